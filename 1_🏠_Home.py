@@ -4,7 +4,7 @@ from os import getenv
 import streamlit as st
 
 # Project imports
-from exceptions import ConfigurationException, ImageGenerationException, TranslationException
+from exceptions import TranslationException
 from publishers.IPublisher import PublisherType
 from publishers.PublisherFactory import PublisherFactory
 from story.StoryFactory import StoryFactory
@@ -112,22 +112,12 @@ def main(progargs: dict):
     # text for creating images in the next step
     story.translate()
 
-    # The visualization text we get in step above 
-    # is used to get images for the story
-    try:
-        story.get_images()
-    except ConfigurationException as e:
-        print(f"Warning: Image generation not configured: {str(e)}. Continuing without images...")
-    except ImageGenerationException as e:
-        print(f"Warning: Error generating images: {str(e)}. Continuing...")
-    except Exception as e:
-        print(f"Warning: Unexpected error during image generation: {str(e)}. Continuing...")
-
-    # Get story audio
+    # Get story audio first, the scenes of the video follow the narration
     story.get_audio('gTTS')
 
-    # The images we get in step above are used to generate a video for the story
-    story.get_video()
+    # The visualization text we get in step above is used to get images for the story,
+    # and the video is assembled from them as they arrive
+    story.get_images_and_video()
 
     # Publish the story now
     publishers = get_publishers(progargs)
@@ -80,22 +80,12 @@ def main(progargs: dict):
     # text for creating images in the next step
     story.translate()
 
-    # The visualization text we get in step above 
-    # is used to get images for the story
-    try:
-        story.get_images()
-    except Exception as e:
-        if "TEXT_TO_IMAGE_URL is not set" in str(e) or "Image generation is not configured" in str(e):
-            print("Warning: Image generation not configured. Continuing without images...")
-        else:
-            print(f"Warning: Error generating images: {str(e)}. Continuing...")
-
-    # Get story audio
+    # Get story audio first, the scenes of the video follow the narration
     story.get_audio('gTTS')
 
-    # The images we get in step above are used to
-    # generate a video for the story
-    story.get_video()
+    # The visualization text we get in step above is used to get images for the story,
+    # and the video is assembled from them as they arrive
+    story.get_images_and_video()
 
     # Publish the story now
     publishers = get_publishers(progargs)
@@ -1,18 +1,12 @@
 import streamlit as st
 import os
 import glob
+import time
 
-from story.Audio import Audio
-from story.Video import Video
-from exceptions import AudioGenerationException
-
-from gtts import gTTS
-from gtts.tokenizer.pre_processors import abbreviations, end_of_line
-import os, pyttsx3, re
-import streamlit as st
-
-from utils.conclusion import conclusion
-from utils.introduction import introduction
+from story.RenderJobs import render_audio, render_video
+from exceptions import AudioGenerationException, ConfigurationException, ImageGenerationException, VideoGenerationException
+from utils.GenerationScheduler import GenerationScheduler
+from utils.RenderQueue import RenderQueue, DONE, FAILED
 
 def display_images_in_columns(images_data, use_story_objects=True):
     icol1, icol2, icol3, icol4 = st.columns([1, 1, 1, 1])
@@ -62,7 +56,43 @@ if st.session_state.get('story'):
 
     if hasattr(story, 'images') and story.images:
         if not mock_selected:
+            # Drafts are quick low cost previews, final images take longer and are generated in the background
+            final_thread = st.session_state.get('final_images_thread')
+            final_running = final_thread is not None and final_thread.is_alive()
+
+            dcol, fcol = st.columns([1, 1])
+            with dcol:
+                if st.button("Quick Draft Preview", disabled=final_running, use_container_width=True):
+                    try:
+                        with st.spinner("Generating draft images..."):
+                            story.get_images(mode="draft")
+                    except (ConfigurationException, ImageGenerationException) as e:
+                        st.error(f"Draft image generation failed: {str(e)}")
+            with fcol:
+                if st.button("Generate Final Images", disabled=final_running, use_container_width=True):
+                    st.session_state['final_images_thread'] = story.get_images(mode="final", background=True)
+                    final_running = True
+
+            if final_running:
+                st.info("Final images are being generated in the background. Refresh the page to see them as they arrive.")
+
             display_images_in_columns(story.images)
+
+            # Images reused from similar sceneries of earlier stories can be regenerated if they do not fit
+            for image in [image for image in story.images if getattr(image, 'reused_from', None)]:
+                rcol1, rcol2 = st.columns([3, 1])
+                with rcol1:
+                    st.caption(f"**{image.title}** reuses the image of scenery **{image.reused_from}**")
+                with rcol2:
+                    if st.button("Regenerate", key=f"regen_{image.title}", disabled=final_running):
+                        try:
+                            with st.spinner(f"Generating image for {image.title}..."):
+                                # A final image, whatever mode the last draft preview left on the image
+                                image.create(scheduler=GenerationScheduler(mode="final"))
+                                story.scenery_index.add(image.title, image.description, image.sentiments, image.path)
+                            st.rerun()
+                        except (ConfigurationException, ImageGenerationException) as e:
+                            st.error(f"Image generation failed: {str(e)}")
         else:
             st.warning("Mock mode displays existing images if present in {outimgs} directory.".format(outimgs=images_dir))
             if os.path.exists(images_dir):
@@ -77,7 +107,7 @@ if st.session_state.get('story'):
     st.divider()  # Add a visual separator
     
     story_title = story.texts['Hindi'].title
-    final_text = introduction.get("Hindi") + story.texts['Hindi'].content + conclusion.get("Hindi")
+    story_text = story.texts['Hindi'].content
 
     options = ["- - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - Select TTS Library - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -", "gtts", "pyttsx3"]
     lib_name = st.selectbox("", options, index=0)
@@ -89,38 +119,54 @@ if st.session_state.get('story'):
     else:
         submit_button_disabled = False
         
-    if lib_name == "gtts":
-        file_extension = ".mp3"
-    elif lib_name == "pyttsx3":
-        file_extension = ".wav"
-        
-    col1, col2, col3 = st.columns([1, 2, 1])
-    with col2:
-        if st.button("Generate Audio", disabled=submit_button_disabled, use_container_width=True):
-            audio_file_name = re.sub(r'_+', '_', re.sub(r'[^\w\s\u0900-\u097F]', '_', story_title).replace(" ", "_")) + file_extension
+    # Audio and video render in worker processes, the page polls their jobs on every rerun
+    queue = RenderQueue.get()
+    rendering = False
+    for kind in ("audio", "video"):
+        job_id = st.session_state.get(f'{kind}_job')
+        job = queue.status(job_id) if job_id else None
+        if not job:
+            continue
 
-            print("Audio file: {path}\nfinal text: {text}".format(path="./output/audios/" + audio_file_name, text=final_text))
-        
-            audio = Audio(file_path="./output/audios/", file_name=audio_file_name)
-        
-            audio_file_name = audio.generate(text=final_text, lib=lib_name)
-            if audio_file_name:
+        if job["status"] == DONE:
+            st.session_state.pop(f'{kind}_job')
+            if kind == "audio":
+                story.use_audio_result(job["result"])
                 st.session_state.audio_generated = True
             else:
-                st.session_state.audio_generated = False
+                story.use_video_result(job["result"])
+                st.success("Video generated, see the Video page.")
+        elif job["status"] == FAILED:
+            st.session_state.pop(f'{kind}_job')
+            st.error(f"{kind.capitalize()} generation failed: {job['error']}")
+        else:
+            rendering = True
+            fraction = job["done"] / job["total"] if job["total"] else 0.0
+            st.progress(min(fraction, 1.0), text=f"Rendering {kind}: {job['done']}/{job['total']} {job['unit'] or 'frames'}")
+
+    col1, col2, col3 = st.columns([1, 2, 1])
+    with col2:
+        if st.button("Generate Audio", disabled=submit_button_disabled or rendering, use_container_width=True):
+            print("Audio file: {path}\nstory text: {text}".format(path=story.audio_job(lib_name)["path"], text=story_text))
+
+            st.session_state['audio_job'] = queue.submit("audio", render_audio, story.audio_job(lib_name), story=getattr(story, 'name', None))
+            st.session_state.audio_generated = False
+            st.rerun()
     
     if st.session_state.get('audio_generated', False):
         st.divider()  # Add a visual separator
 
         col1, col2, col3 = st.columns([1, 2, 1])
         with col2:
-            if st.button("Generate Video", disabled=not st.session_state.audio_generated, use_container_width=True):
-                video_file_name = re.sub(r'_+', '_', re.sub(r'[^\w\s\u0900-\u097F]', '_', story_title).replace(" ", "_")) + ".mp4"
+            if st.button("Generate Video", disabled=not st.session_state.audio_generated or rendering, use_container_width=True):
+                try:
+                    st.session_state['video_job'] = queue.submit("video", render_video, story.video_job(), story=getattr(story, 'name', None))
+                    st.rerun()
+                except VideoGenerationException as e:
+                    st.error(f"Video generation failed: {str(e)}")
 
-                print("Video file: {path}: ".format(path="./output/videos/" + video_file_name))
-
-                video = Video(file_path="./output/videos/", file_name=video_file_name)
-                
-                video_file_name = video.generate(video_path="./output/videos/", file_name=video_file_name, image_paths=story.images)
+    if rendering:
+        time.sleep(1)
+        st.rerun()
 else:
     st.warning("No story found. Please go to the Home page and fetch a story first.")
\ No newline at end of file
@@ -1,6 +1,82 @@
 import streamlit as st
 import os
 from exceptions import VideoGenerationException
+from story.RenderJobs import render_video
+from utils.RenderQueue import RenderQueue, DONE, FAILED
+
+# Session keys of the render jobs, by video quality, see story.Video.VIDEO_QUALITIES
+JOB_KEYS = {"preview": "preview_job", "final": "video_job"}
+
+def submit_video_job(story, quality: str = "final") -> bool:
+    """Queue the video of story for rendering in the background, the page polls the job while it runs."""
+    try:
+        kind = "preview" if quality == "preview" else "video"
+        params = story.video_job(quality=quality)
+        st.session_state[JOB_KEYS[quality]] = RenderQueue.get().submit(kind, render_video, params, story=getattr(story, 'name', None))
+        return True
+    except VideoGenerationException as e:
+        st.error(f"Video generation failed: {str(e)}")
+    except Exception as e:
+        st.error(f"Unexpected error during video generation: {str(e)}")
+    return False
+
+def running_jobs() -> dict:
+    queue = RenderQueue.get()
+    jobs = {quality: queue.status(st.session_state[key]) for quality, key in JOB_KEYS.items() if st.session_state.get(key)}
+    return {quality: job for quality, job in jobs.items() if job}
+
+@st.fragment(run_every=1)
+def show_render_progress(story) -> None:
+    """
+    Progress of the running render jobs. Only this fragment reruns while they run, so a preview keeps playing,
+    and the whole page reruns once a job is done.
+    """
+    for quality, job in running_jobs().items():
+        if job["status"] == DONE:
+            st.session_state.pop(JOB_KEYS[quality])
+            story.use_video_result(job["result"])
+            # The final video renders in the background while the preview is checked
+            if quality == "preview" and not st.session_state.get(JOB_KEYS["final"]):
+                submit_video_job(story, "final")
+            st.rerun()
+        elif job["status"] == FAILED:
+            st.session_state.pop(JOB_KEYS[quality])
+            st.session_state['render_error'] = f"Rendering the {quality} video failed: {job['error']}"
+            st.rerun()
+        else:
+            fraction = job["done"] / job["total"] if job["total"] else 0.0
+            eta = f", about {int(job['eta'])}s left" if job["eta"] is not None else ""
+            st.progress(min(fraction, 1.0), text=f"Rendering the {quality} video: {job['done']}/{job['total']} {job['unit'] or 'frames'}{eta}")
+
+def publish_form(story, video_file: str, note: str = None, disabled: bool = False) -> None:
+    with st.form(key='video_form'):
+        st.video(video_file, format="video/mp4", start_time=0)
+        if note:
+            st.caption(note)
+        
+        st.write("---")
+        st.subheader("Next Steps")
+        submit_video = st.form_submit_button(label='📤 Publish to Social Media', disabled=disabled)
+        
+        if submit_video:
+            try:
+                from publishers.PublisherFactory import get_publishers
+                
+                # Get the main args from session state
+                mainargs = st.session_state.get('mainargs', {})
+                
+                # Publishing renders the final video first if there is only a preview
+                with st.spinner("Publishing to selected platforms..."):
+                    publishers = get_publishers(mainargs)
+                    if publishers:
+                        story.publish(publishers=publishers)
+                        st.success("Story published successfully!")
+                        st.balloons()
+                    else:
+                        st.warning("No publishers configured. Please check your social media settings in the .env file.")
+                        
+            except Exception as e:
+                st.error(f"Error publishing story: {str(e)}")
 
 st.title("🎥 Video Generation")
 
@@ -32,76 +108,45 @@ if st.session_state.get('story'):
     except Exception:
         video_exists = False
 
+    if st.session_state.get('render_error'):
+        st.error(st.session_state.pop('render_error'))
+
+    jobs = running_jobs()
+    if jobs:
+        show_render_progress(story)
+
+    preview_file = getattr(story.video, 'preview_path', None) if getattr(story, 'video', None) else None
+    preview_exists = bool(preview_file) and os.path.exists(preview_file)
+
     if video_exists and current_video_file:
-        with st.form(key='video_form'):
-            st.video(current_video_file, format="video/mp4", start_time=0)
-            
-            st.write("---")
-            st.subheader("Next Steps")
-            submit_video = st.form_submit_button(label='📤 Publish to Social Media')
-            
-            if submit_video:
-                try:
-                    from publishers.PublisherFactory import get_publishers
-                    
-                    # Get the main args from session state
-                    mainargs = st.session_state.get('mainargs', {})
-                    
-                    with st.spinner("Publishing to selected platforms..."):
-                        publishers = get_publishers(mainargs)
-                        if publishers:
-                            story.publish(publishers=publishers)
-                            st.success("Story published successfully!")
-                            st.balloons()
-                        else:
-                            st.warning("No publishers configured. Please check your social media settings in the .env file.")
-                            
-                except Exception as e:
-                    st.error(f"Error publishing story: {str(e)}")
-    else:        
-        # Check if audio is available first
-        audio_available = False
-        try:
-            if hasattr(story, 'audio') and story.audio and hasattr(story.audio, 'path') and story.audio.path:
-                audio_available = os.path.exists(story.audio.path)
-        except Exception:
-            audio_available = False
-            
-        if st.button("🎬 Generate Video", type="primary"):
-            try:
-                with st.spinner("Generating video... This may take several minutes."):
-                    video_file = story.get_video()
-                    
-                if video_file and os.path.exists(video_file):
-                    st.success("Video generated successfully!")
-                    st.balloons()
+        publish_form(story, current_video_file)
+    elif preview_exists:
+        # The preview is enough to check the pacing and the order of the images
+        rendering_final = "final" in jobs
+        publish_form(
+            story, preview_file,
+            note="Low resolution preview. " + ("The final video is rendering in the background." if rendering_final else
+                                               "The final video is rendered when the story is published."),
+            disabled=rendering_final
+        )
+    
+    if not (video_exists and current_video_file) and not jobs:
+        pcol, fcol = st.columns([1, 1])
+        with pcol:
+            if st.button("⚡ Preview Video", type="primary", use_container_width=True):
+                if submit_video_job(story, "preview"):
                     st.rerun()
-                else:
-                    st.error("Failed to generate video file.")
-                    
-            except VideoGenerationException as e:
-                st.error(f"Video generation failed: {str(e)}")
-            except Exception as e:
-                st.error(f"Unexpected error during video generation: {str(e)}")
-                
+        with fcol:
+            if st.button("🎬 Generate Final Video", use_container_width=True):
+                if submit_video_job(story, "final"):
+                    st.rerun()
+
         # Show regenerate option if video exists but might be corrupted
         if current_video_file and not video_exists:
             st.warning(f"Video file was expected at {current_video_file} but not found.")
             if st.button("🔄 Regenerate Video"):
-                try:
-                    with st.spinner("Regenerating video..."):
-                        video_file = story.get_video()
-                        
-                    if video_file and os.path.exists(video_file):
-                        st.success("Video regenerated successfully!")
-                        st.rerun()
-                    else:
-                        st.error("Failed to regenerate video file.")
-                        
-                except VideoGenerationException as e:
-                    st.error(f"Video regeneration failed: {str(e)}")
-                except Exception as e:
-                    st.error(f"Unexpected error during video regeneration: {str(e)}")
+                if submit_video_job(story, "final"):
+                    st.rerun()
 else:
     st.title("🎥 Video Generation")
     st.warning("No story found. Please go to the Home page and fetch a story first.")
@@ -89,12 +89,12 @@ class FacebookPublisher(IPublisher):
             
             # Get media if available
             images = content.get("images", [])
-            videos = content.get("videos", [])
+            video = self.select_video(content)
             audios = content.get("audios", [])
             
             # Publish to Facebook
-            if videos:
-                self._post_video(post_message, videos[0])
+            if video:
+                self._post_video(post_message, video)
             elif images:
                 self._post_image(post_message, images[0])
             else:
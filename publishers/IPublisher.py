@@ -9,12 +9,24 @@ class PublisherType(Enum):
     YOUTUBE = 4
 
 class IPublisher(ABC):
+    # Video rendition that suits the platform, one of story.Video.VIDEO_RENDITIONS
+    video_rendition = "landscape"
+
     def __init__(self, credentials: dict=None) -> None:
         super().__init__()
 
         self.credentials = credentials
 
 
+    def select_video(self, content: dict) -> str:
+        """Path of the video rendition for this platform, falls back to the first video of the content."""
+        renditions = content.get("renditions", {})
+        if renditions.get(self.video_rendition):
+            return renditions[self.video_rendition]
+
+        videos = content.get("videos", [])
+        return videos[0] if videos else None
+
     @abstractmethod
     def login(self) -> None:
         pass
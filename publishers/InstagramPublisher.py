@@ -1,3 +1,4 @@
+import os
 from os import getenv
 from dotenv import load_dotenv
 import requests
@@ -6,10 +7,17 @@ import json
 # Project imports
 from publishers.IPublisher import IPublisher
 from exceptions.ConfigurationException import ConfigurationException
+from utils import MediaProbe
 
 load_dotenv()
 
+# Video duration limits in seconds
+MIN_VIDEO_SECONDS = 3
+MAX_VIDEO_SECONDS = 15 * 60
+
 class InstagramPublisher(IPublisher):
+    video_rendition = "square"
+
     def __init__(self, credentials: dict) -> None:
         super().__init__(credentials=credentials)
         self.mock_mode = getenv('INSTAGRAM_MOCK_MODE', 'false').lower() == 'true'
@@ -86,9 +94,15 @@ class InstagramPublisher(IPublisher):
                 print("Warning: No image available for Instagram publishing. Instagram requires at least one image.")
                 return
             
-            # Get video if available
-            videos = content.get("videos", [])
-            first_video = videos[0] if videos else None
+            # Get the square video if available
+            first_video = self.select_video(content)
+
+            # Instagram only accepts videos between 3 seconds and 15 minutes, checked from the file headers
+            if first_video and os.path.exists(first_video):
+                video_duration = MediaProbe.duration(first_video)
+                if not MIN_VIDEO_SECONDS <= video_duration <= MAX_VIDEO_SECONDS:
+                    print(f"Warning: Video is {video_duration:.0f}s long, outside Instagram's limits. Posting image instead.")
+                    first_video = None
             
             # Publish to Instagram
             if first_video:
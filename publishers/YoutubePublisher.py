@@ -14,6 +14,7 @@ import pickle
 # Project imports
 from publishers.IPublisher import IPublisher
 from exceptions.ConfigurationException import ConfigurationException
+from utils import MediaProbe
 
 load_dotenv()
 
@@ -22,6 +23,7 @@ SCOPES = ['https://www.googleapis.com/auth/youtube.upload']
 API_SERVICE_NAME = 'youtube'
 API_VERSION = 'v3'
 VALID_PRIVACY_STATUSES = ('public', 'private', 'unlisted')
+UNVERIFIED_MAX_SECONDS = 15 * 60
 
 # Retry settings
 MAX_RETRIES = 3
@@ -103,12 +105,17 @@ class YoutubePublisher(IPublisher):
         """Publish content to YouTube."""
         try:
             # Extract video and metadata from content
-            videos = content.get("videos", [])
-            if not videos:
+            video_file = self.select_video(content)  # The 16:9 rendition
+            if not video_file:
                 print("Warning: No video content available for YouTube publishing")
                 return
-                
-            video_file = videos[0]  # Use first video
+
+            # Unverified channels cannot upload videos longer than 15 minutes
+            if os.path.exists(video_file):
+                video_duration = MediaProbe.duration(video_file)
+                print(f"Video duration: {video_duration:.1f}s")
+                if video_duration > UNVERIFIED_MAX_SECONDS:
+                    print("Warning: Video is longer than 15 minutes, the upload fails unless the channel is verified")
             
             # Extract text content for title and description
             text_content = content.get("text", {})
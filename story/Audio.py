@@ -1,70 +1,226 @@
+from concurrent.futures import ThreadPoolExecutor
 from gtts import gTTS
 from gtts.tokenizer.pre_processors import abbreviations, end_of_line
 from exceptions import AudioGenerationException
-from os import makedirs, path
-import pyttsx3
-import time
+from os import getenv, makedirs, path
+import io, json, os, re, wave
+
+from mutagen import File as MutagenFile
+from mutagen.mp3 import MP3
+
+from utils import Mp3
+from utils.AudioCache import AudioCache
+from utils.Pyttsx3Worker import Pyttsx3Worker
+from utils.Utils import split_sentences
+
+# Settings that change the synthesized audio, and so are part of the audio cache key
+TTS_SETTINGS = {
+    'gtts': {"language": "hi", "voice": None, "rate": "slow"},
+    'pyttsx3': {"language": "hi", "voice": "hi", "rate": 150}
+}
+
+TTS_EXTENSIONS = {
+    'gtts': ".mp3",
+    'pyttsx3': ".wav"
+}
 
 class Audio:
     def __init__(self, file_path: str, file_name: str):
         self.file_path = path.abspath(file_path)
         self.file_name = file_name
+        self.max_workers = int(getenv('GTTS_MAX_WORKERS', 4))  # Bounded, as Google throttles too many parallel requests
+        self.cache = AudioCache(cache_dir=path.join(self.file_path, "cache"))
+        self.path = None
+        self.duration = None
+        self.timings = []  # Start and end of every spoken sentence, see _timing_map()
+        self.timings_path = None
 
         if not self.file_path:
             makedirs(file_path, exist_ok=True)
     
-    def _get_audio_gtts(self, text: str, audio_file_path: str):
+    def _synthesize_gtts_chunk(self, text: str) -> bytes:
         gtts_lang = 'hi'  # Hindi language
-        reply_obj = gTTS(text=text, lang=gtts_lang, slow=True)
-        reply_obj.save(audio_file_path)
-
-    def _get_audio_pyttsx3(self, text: str, audio_file_path: str):
+        buffer = io.BytesIO()
         try:
-            engine = pyttsx3.init()
-
-            # Set properties for better audio quality
-            engine.setProperty('rate', 150)  # Speed of speech
-            engine.setProperty('volume', 0.9)  # Volume level (0.0 to 1.0)
-
-            voices = engine.getProperty('voices')
-            for voice in voices:
-                if voice.languages and any('hi' in lang.lower() for lang in voice.languages):
-                    engine.setProperty('voice', voice.id)
-                    break
-            
-            engine.save_to_file(text, audio_file_path)
-            engine.runAndWait()
-                            
-            # Give a small delay to ensure file is written
-            time.sleep(0.5)
+            gTTS(text=text, lang=gtts_lang, slow=True).write_to_fp(buffer)
         except Exception as e:
+            # gTTS also fails with plain AssertionErrors, e.g. for text it finds nothing to speak in
             raise AudioGenerationException(
-                f"Audio generation failed with pyttsx3: {str(e)}",
-                library='pyttsx3',
-                language="hi",
+                f"Audio generation failed with gTTS: {str(e)}",
+                library='gtts',
+                language=gtts_lang,
                 details={"error": str(e), "text_length": len(text)}
             )
+        return buffer.getvalue()
+
+    @staticmethod
+    def _speakable_sentences(text: str, lib: str) -> list:
+        """
+        Sentences of text, each with something to speak. Sentences of punctuation alone, e.g. "...", are joined to
+        the sentence before them, or the one after them at the start, so the sentences still cover the whole text.
+        """
+        sentences = []
+        pending = ""  # Punctuation met before the first speakable sentence
+        for sentence in split_sentences(text):
+            if not re.search(r'\w', sentence):
+                if sentences:
+                    sentences[-1] += " " + sentence
+                else:
+                    pending += sentence + " "
+                continue
+            sentences.append(pending + sentence)
+            pending = ""
+
+        if not sentences:
+            raise AudioGenerationException(
+                "No text to synthesize",
+                library=lib,
+                language=TTS_SETTINGS[lib]["language"],
+                details={"text": text[:100]}
+            )
+        return sentences
+
+    def _get_audio_gtts(self, text: str, audio_file_path: str) -> list:
+        """Synthesize text to audio_file_path and return the sentences with their spoken durations."""
+        # gTTS works through its chunks one request at a time, so sentences are synthesized concurrently
+        # instead and their MP3 frames joined in order, which needs no re-encoding
+        sentences = Audio._speakable_sentences(text, 'gtts')
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            segments = list(pool.map(self._synthesize_gtts_chunk, sentences))
+
+        with open(audio_file_path, 'wb') as f:
+            f.write(Mp3.concat(segments))
+
+        # mutagen reads the duration from the frame headers, nothing is decoded
+        return [{"text": sentence, "duration": MP3(io.BytesIO(segment)).info.length} for sentence, segment in zip(sentences, segments)]
+
+    def _get_audio_pyttsx3(self, text: str, audio_file_path: str) -> list:
+        """Synthesize text to audio_file_path and return the sentences with their spoken durations."""
+        # The worker process keeps one initialized engine for all stories and reports back once the file is flushed,
+        # so synthesizing sentence by sentence costs little and gives the duration of every sentence
+        worker = Pyttsx3Worker.get(rate=TTS_SETTINGS['pyttsx3']['rate'], volume=0.9, language=TTS_SETTINGS['pyttsx3']['language'])
+
+        sentences = Audio._speakable_sentences(text, 'pyttsx3')
+        sentence_paths = [f"{audio_file_path}.{i}.wav" for i in range(len(sentences))]
+        try:
+            timings = []
+            for sentence, sentence_path in zip(sentences, sentence_paths):
+                worker.synthesize(sentence, sentence_path)
+                timings.append({"text": sentence, "duration": MutagenFile(sentence_path).info.length})
+
+            self._join_segments(sentence_paths, audio_file_path, 'pyttsx3')
+            return timings
         finally:
-            try:
-                engine.stop()
-            except:
-                pass
+            for sentence_path in sentence_paths:
+                if path.exists(sentence_path):
+                    os.remove(sentence_path)
         
-    def generate(self, text: str, lib: str = 'gtts'):
+    def _render_segment(self, text: str, lib: str) -> dict:
+        """Synthesize a piece of narration, or fetch it from the cache, and return its cache entry."""
+        # The cache is keyed by the text and TTS settings, not the file name, so edited text is synthesized again
+        # while the same text under another title is not
+        key = AudioCache.key(text, lib, **TTS_SETTINGS[lib])
+        entry = self.cache.get(key)
+        if entry:
+            return entry
+
+        segment_path = path.join(self.cache.cache_dir, key + ".part" + TTS_EXTENSIONS[lib])
+        if lib == 'gtts':
+            sentences = self._get_audio_gtts(text, segment_path)
+        else:
+            sentences = self._get_audio_pyttsx3(text, segment_path)
+
+        try:
+            return self.cache.put(key, segment_path, duration=MutagenFile(segment_path).info.length, sentences=sentences)
+        finally:
+            os.remove(segment_path)
+
+    def _join_segments(self, segment_paths: list, audio_file_path: str, lib: str) -> None:
+        """Join segments end to end, MP3 at frame level and WAV at sample level, neither is re-encoded."""
+        if lib == 'gtts':
+            segments = []
+            for segment_path in segment_paths:
+                with open(segment_path, 'rb') as f:
+                    segments.append(f.read())
+            with open(audio_file_path, 'wb') as f:
+                f.write(Mp3.concat(segments))
+            return
+
+        with wave.open(audio_file_path, 'wb') as output:
+            for i, segment_path in enumerate(segment_paths):
+                with wave.open(segment_path, 'rb') as segment:
+                    if i == 0:
+                        output.setparams(segment.getparams())
+                    output.writeframes(segment.readframes(segment.getnframes()))
+
+    @staticmethod
+    def _timing_map(segments: list) -> list:
+        """Lay the sentences of consecutive (label, text, cache entry) segments out on the timeline of the joined audio."""
+        timings = []
+        segment_start = 0.0
+
+        for label, text, entry in segments:
+            # Entries cached before timings were recorded are treated as a single sentence
+            sentences = entry.get("sentences") or [{"text": text, "duration": entry["duration"]}]
+
+            start = segment_start
+            for sentence in sentences:
+                timings.append({
+                    "index": len(timings),
+                    "segment": label,
+                    "start": round(start, 3),
+                    "end": round(start + sentence["duration"], 3),
+                    "text": sentence["text"]
+                })
+                start += sentence["duration"]
+
+            segment_start += entry["duration"]
+
+        return timings
+
+    def generate(self, text: str, lib: str = 'gtts', intro: str = None, outro: str = None):
+        """
+        Generate narration for text, optionally between an introduction and a conclusion.
+
+        The introduction and conclusion are the same for every story, they are rendered once
+        and come from the audio cache afterwards, so only the story text needs synthesis.
+        A timing map with the start and end of every sentence is written next to the audio.
+        """
+        lib = lib.lower()
+        if lib not in TTS_SETTINGS:
+            raise AudioGenerationException(
+                f"Unsupported audio generation library: {lib}",
+                library=lib,
+                language="hi",
+                details={"text_length": len(text)}
+            )
+
         audio_file_path = self.file_path + "/" + lib + "_" + self.file_name
-        
-        if not path.exists(audio_file_path):
-            if lib.lower() == 'gtts':
-                self._get_audio_gtts(text, audio_file_path)
-            elif lib.lower() == 'pyttsx3':
-                self._get_audio_pyttsx3(text, audio_file_path)                        
-            else:
-                raise AudioGenerationException(
-                    f"Unsupported audio generation library: {lib}",
-                    library=lib,
-                    language="hi",
-                    details={"text_length": len(text)}
-                )
+
+        segments = [(label, segment, self._render_segment(segment, lib)) for label, segment in (("intro", intro), ("body", text), ("outro", outro)) if segment and segment.strip()]
+        entries = [entry for _, _, entry in segments]
+        if not entries:
+            raise AudioGenerationException(
+                "No text to synthesize",
+                library=lib,
+                language=TTS_SETTINGS[lib]["language"],
+                details={"text_length": len(text or "")}
+            )
+        if len(entries) == 1:
+            self.cache.link(entries[0], audio_file_path)
+        else:
+            # The file may still be a hard link into the cache from an earlier run, writing through it would corrupt the cache
+            if path.exists(audio_file_path):
+                os.remove(audio_file_path)
+            self._join_segments([entry["path"] for entry in entries], audio_file_path, lib)
+
+        self.path = audio_file_path
+        self.duration = sum(entry["duration"] for entry in entries)
+
+        self.timings = Audio._timing_map(segments)
+        self.timings_path = path.splitext(audio_file_path)[0] + ".timing.json"
+        with open(self.timings_path, 'w', encoding='utf-8') as f:
+            json.dump(self.timings, f, indent=2, ensure_ascii=False)
 
         # In any case, return the path to the audio file
-        return audio_file_path
\ No newline at end of file
+        return audio_file_path
@@ -0,0 +1,148 @@
+import json, subprocess
+import numpy as np
+from os import getenv, path
+
+from exceptions import AudioGenerationException
+from story.Audio import Audio
+from utils.Ffmpeg import run_ffmpeg
+
+class AudioPostProcessor:
+    """
+    Post-processing of narration between Audio.generate() and Video.generate().
+
+    The narration is decoded once into a NumPy PCM buffer. Long silences are
+    shortened, loudness is normalized and an optional music bed is mixed in,
+    ducked under the voice, all with vectorized operations. The result is encoded
+    once. The sentence timing map of the audio is moved along with the trimmed
+    silences so that it stays valid for the later stages.
+    """
+    SAMPLE_RATE = 44100
+    WINDOW = 0.02  # Seconds per analysis window
+
+    def __init__(self, music_path: str = None, silence_threshold_db: float = -40.0, max_silence: float = 0.6,
+                 target_db: float = -18.0, peak_db: float = -1.0, bed_db: float = -20.0, duck_db: float = -32.0):
+        self.music_path = music_path or getenv('AUDIO_MUSIC_BED')
+        self.silence_threshold_db = silence_threshold_db
+        self.max_silence = max_silence
+        self.target_db = target_db
+        self.peak_db = peak_db
+        self.bed_db = bed_db
+        self.duck_db = duck_db
+
+    @staticmethod
+    def _decode(file_path: str) -> np.ndarray:
+        pcm = run_ffmpeg(["-i", file_path, "-f", "s16le", "-acodec", "pcm_s16le", "-ac", "1", "-ar", str(AudioPostProcessor.SAMPLE_RATE), "pipe:1"])
+        return np.frombuffer(pcm, dtype=np.int16).astype(np.float32) / 32768.0
+
+    @staticmethod
+    def _encode(samples: np.ndarray, file_path: str) -> None:
+        pcm = (np.clip(samples, -1.0, 1.0) * 32767).astype(np.int16).tobytes()
+        codec = ["-c:a", "libmp3lame", "-b:a", "128k"] if file_path.endswith(".mp3") else ["-c:a", "pcm_s16le"]
+        run_ffmpeg(["-f", "s16le", "-ar", str(AudioPostProcessor.SAMPLE_RATE), "-ac", "1", "-i", "pipe:0"] + codec + [file_path], input=pcm)
+
+    @staticmethod
+    def _db_to_gain(db: float) -> float:
+        return 10 ** (db / 20)
+
+    def _window_levels(self, samples: np.ndarray) -> tuple:
+        """RMS level in dBFS of every analysis window, and the window size in samples."""
+        window = int(AudioPostProcessor.SAMPLE_RATE * AudioPostProcessor.WINDOW)
+        padded = np.pad(samples, (0, (-len(samples)) % window))
+        rms = np.sqrt(np.mean(padded.reshape(-1, window) ** 2, axis=1))
+        return 20 * np.log10(np.maximum(rms, 1e-9)), window
+
+    def _silence_keep_mask(self, voiced: np.ndarray) -> np.ndarray:
+        """Per window keep mask that shortens every run of silence to at most max_silence."""
+        max_windows = int(self.max_silence / AudioPostProcessor.WINDOW)
+
+        # 1-based position of every window within its run of silence
+        silent = (~voiced).astype(np.int64)
+        last_voiced = np.maximum.accumulate(np.where(silent == 0, np.arange(len(silent)), -1))
+        position = np.arange(len(silent)) - last_voiced
+
+        # Keep the first half and last half of the allowed silence of each run, dropping its middle
+        run_ids = np.cumsum(np.diff(np.concatenate(([0], silent))) == 1) * silent
+        run_lengths = np.bincount(run_ids)[run_ids]
+        from_end = run_lengths - position + 1
+        return (silent == 0) | (position <= max_windows // 2) | (from_end <= max_windows - max_windows // 2)
+
+    def _music_bed(self, voiced_windows: np.ndarray, window: int, length: int) -> np.ndarray:
+        music = AudioPostProcessor._decode(self.music_path)
+        if not len(music):
+            return np.zeros(length, dtype=np.float32)
+
+        music = np.resize(music, length)  # Loops the music to the narration length
+
+        # Duck under the voice, smoothing the envelope over 300ms so that the gain does not pump.
+        # The envelope is built per analysis window and only then stretched to the sample rate.
+        envelope = np.where(voiced_windows, self._db_to_gain(self.duck_db), self._db_to_gain(self.bed_db))
+        smoothing = max(1, int(0.3 / AudioPostProcessor.WINDOW))
+        envelope = np.convolve(np.pad(envelope, smoothing, mode="edge"), np.ones(smoothing) / smoothing, mode="same")[smoothing:-smoothing]
+        envelope = np.repeat(envelope.astype(np.float32), window)[:length]
+        envelope = np.pad(envelope, (0, length - len(envelope)), mode="edge")
+
+        music_rms = np.sqrt(np.mean(music ** 2)) or 1.0
+        return music / music_rms * self._db_to_gain(self.target_db) * envelope
+
+    def _remap_timings(self, timings: list, keep_samples: np.ndarray) -> list:
+        """Move sentence boundaries to where they land once silences are trimmed."""
+        kept_before = np.concatenate(([0], np.cumsum(keep_samples)))
+        last = len(keep_samples)
+
+        def remap(seconds: float) -> float:
+            index = min(int(round(seconds * AudioPostProcessor.SAMPLE_RATE)), last)
+            return round(float(kept_before[index]) / AudioPostProcessor.SAMPLE_RATE, 3)
+
+        return [dict(timing, start=remap(timing["start"]), end=remap(timing["end"])) for timing in timings]
+
+    def process(self, audio: Audio) -> str:
+        """Post-process the narration of audio into a new file, updating its path, duration and timings."""
+        if not audio.path or not path.exists(audio.path):
+            raise AudioGenerationException(
+                "No narration to post-process, generate the audio first",
+                details={"audio_path": audio.path}
+            )
+
+        base, extension = path.splitext(audio.path)
+        output_path = base + "_mastered" + extension
+
+        try:
+            samples = AudioPostProcessor._decode(audio.path)
+
+            levels, window = self._window_levels(samples)
+            voiced = levels > self.silence_threshold_db
+            keep_windows = self._silence_keep_mask(voiced)
+            keep_samples = np.repeat(keep_windows, window)[:len(samples)]
+            voiced_samples = np.repeat(voiced, window)[:len(samples)][keep_samples]
+            samples = samples[keep_samples]
+
+            # Normalize on the level of the voiced parts only, then make sure the peaks stay below the ceiling
+            voiced_rms = np.sqrt(np.mean(samples[voiced_samples] ** 2)) if voiced_samples.any() else 0.0
+            if voiced_rms > 0:
+                samples = samples * (self._db_to_gain(self.target_db) / voiced_rms)
+            peak = np.max(np.abs(samples)) if len(samples) else 0.0
+            if peak > self._db_to_gain(self.peak_db):
+                samples = samples * (self._db_to_gain(self.peak_db) / peak)
+
+            if self.music_path and path.exists(self.music_path):
+                samples = samples + self._music_bed(voiced[keep_windows], window, len(samples))
+                peak = np.max(np.abs(samples))
+                if peak > self._db_to_gain(self.peak_db):
+                    samples = samples * (self._db_to_gain(self.peak_db) / peak)
+
+            AudioPostProcessor._encode(samples, output_path)
+        except subprocess.CalledProcessError as e:
+            raise AudioGenerationException(
+                f"Audio post-processing failed: {e.stderr}",
+                details={"audio_path": audio.path, "error": str(e)}
+            )
+
+        audio.path = output_path
+        audio.duration = len(samples) / AudioPostProcessor.SAMPLE_RATE
+        if audio.timings:
+            audio.timings = self._remap_timings(audio.timings, keep_samples)
+            audio.timings_path = base + "_mastered.timing.json"
+            with open(audio.timings_path, 'w', encoding='utf-8') as f:
+                json.dump(audio.timings, f, indent=2, ensure_ascii=False)
+
+        return output_path
@@ -24,6 +24,27 @@ class IStory(ABC):
     def get_audio(self):
         pass
 
+    @abstractmethod
+    def get_images_and_video(self):
+        pass
+
     @abstractmethod
     def get_sceneries(self):
-        pass
\ No newline at end of file
+        pass
+
+    # Renders run in the background through utils.RenderQueue, see story.RenderJobs
+    @abstractmethod
+    def video_job(self) -> dict:
+        pass
+
+    @abstractmethod
+    def use_video_result(self, result: dict):
+        pass
+
+    @abstractmethod
+    def audio_job(self, lib: str) -> dict:
+        pass
+
+    @abstractmethod
+    def use_audio_result(self, result: dict):
+        pass
@@ -4,18 +4,32 @@ import requests, time
 from string import punctuation
 from utils.Utils import make_api_request
 from utils.Utils import urlify
+from utils.GenerationScheduler import GENERATION_PROFILES, GenerationScheduler
+from utils.HedgePolicy import HedgePolicy
+from utils.JobJournal import JobJournal
+from utils.Upscaler import generation_size, parse_size, upscale_image
 from exceptions import ConfigurationException, ImageGenerationException
 
 load_dotenv()
 
 class Image:
-    def __init__(self, title: str, path: str, description: str, sentiments: list):
-        self.path = path
+    def __init__(self, title: str, path: str, description: str, sentiments: list, journal: JobJournal = None, hedge_policy: HedgePolicy = None):
+        self.directory = path  # Where images are written
+        self.path = None  # The image file, once created
         self.description = description
         self.sentiments = sentiments
         self.title = title
-        self.width = 512
-        self.height = 512
+        self.journal = journal
+        self.hedge_policy = hedge_policy
+        self.reused_from = None  # Title of the past scenery whose image is reused, if any
+        self.scheduler = None
+        self.mode = "final"
+        self.picked_profile = dict(GENERATION_PROFILES[0])  # As picked by the scheduler
+        self.profile = dict(self.picked_profile)  # As requested, adjusted for upscaling
+        self.width = self.profile["width"]
+        self.height = self.profile["height"]
+        # When set, a smaller image is generated and upscaled locally to this size
+        self.upscale_to = parse_size(getenv('IMAGE_UPSCALE_TO'))
         self.t2i_url = getenv('TEXT_TO_IMAGE_URL', "https://stablehorde.net/api/v2/generate/async")
         self.aihorde_api_key = getenv('AIHORDE_API_KEY')
     
@@ -28,17 +42,17 @@ class Image:
                 "cfg_scale": 7.5,
                 "denoising_strength": 1.0,
                 "seed": "342",
-                "height": 512,
-                "width": 512,
-                "steps": 30
+                "height": self.profile["height"],
+                "width": self.profile["width"],
+                "steps": self.profile["steps"]
             },
             "nsfw": True,
             "trusted_workers": True,
-            "slow_workers": True,
+            "slow_workers": self.profile["slow_workers"],
             "censor_nsfw": False,
             "workers": [],
             "worker_blacklist": False,
-            "models": ["stable_diffusion"],
+            "models": self.profile["models"],
             "source_image": "",
             "source_processing": "img2img",
             "source_mask": "",
@@ -47,29 +61,75 @@ class Image:
             "replacement_filter": True
         }
     
-    def _poll_aihorde_job_completion(self, job_id: str, api_key: str, prompt: str) -> None:
-        """Poll AI Horde job until completion or failure."""
-        check_url = f"https://stablehorde.net/api/v2/generate/check/{job_id}"
+    def _poll_aihorde_job_completion(self, job_id: str, api_key: str, prompt: str) -> str:
+        """
+        Poll AI Horde job until completion or failure and return the id of the job that completed.
+
+        With a hedge policy set, a stuck or slow job gets a duplicate submitted alongside it,
+        the first of the two to finish wins and the other one is cancelled.
+        """
         headers = {"apikey": api_key}
+        job_ids = [job_id]
+        last_progress = {job_id: None}
+        stalled_polls = {job_id: 0}
         
         while True:
-            check_response = requests.get(check_url, headers=headers)
-            check_response.raise_for_status()
-            check_result = check_response.json()
-            
-            if check_result.get("done", False):
-                print("Image generation completed!")
-                break
-            elif check_result.get("faulted", False):
-                raise ImageGenerationException(
-                    "Image generation failed on AI Horde",
-                    prompt=prompt[:100] + "...",
-                    details={"job_id": job_id, "status": check_result}
-                )
-            else:
-                wait_time = check_result.get("wait_time", 30)
-                print(f"Still processing... waiting {wait_time} seconds")
-                time.sleep(min(wait_time, 30))  # Wait max 30 seconds between checks
+            wait_time = 30
+            for current_id in list(job_ids):
+                check_url = f"https://stablehorde.net/api/v2/generate/check/{current_id}"
+                check_response = requests.get(check_url, headers=headers)
+                check_response.raise_for_status()
+                check_result = check_response.json()
+                if self.scheduler:
+                    self.scheduler.observe(check_result)
+                
+                if check_result.get("done", False):
+                    print("Image generation completed!")
+                    for loser_id in job_ids:
+                        if loser_id != current_id:
+                            self._cancel_aihorde_job(loser_id, api_key)
+                    return current_id
+                elif check_result.get("faulted", False):
+                    if len(job_ids) > 1:
+                        # The other hedged job may still succeed
+                        job_ids.remove(current_id)
+                        if self.journal:
+                            self.journal.update(current_id, JobJournal.FAULTED)
+                        continue
+                    raise ImageGenerationException(
+                        "Image generation failed on AI Horde",
+                        prompt=prompt[:100] + "...",
+                        details={"job_id": current_id, "status": check_result}
+                    )
+
+                progress = (check_result.get("finished"), check_result.get("processing"), check_result.get("queue_position"))
+                stalled_polls[current_id] = stalled_polls[current_id] + 1 if progress == last_progress[current_id] else 0
+                last_progress[current_id] = progress
+                wait_time = min(wait_time, check_result.get("wait_time", 30))
+
+            # Hedge a single outstanding job only, and only while the per story cost cap allows it
+            if self.hedge_policy and len(job_ids) == 1 and self.hedge_policy.should_hedge(check_result, stalled_polls[job_ids[0]]):
+                if self.hedge_policy.try_acquire():
+                    hedge_id = self._submit_aihorde_job(prompt)
+                    print(f"Job {job_ids[0]} is slow, submitted hedge job {hedge_id}")
+                    job_ids.append(hedge_id)
+                    last_progress[hedge_id] = None
+                    stalled_polls[hedge_id] = 0
+
+            print(f"Still processing... waiting {wait_time} seconds")
+            time.sleep(min(wait_time, 30))  # Wait max 30 seconds between checks
+
+    def _cancel_aihorde_job(self, job_id: str, api_key: str) -> None:
+        """Cancel a job that lost the hedge race, failures are only logged as the job result is not needed."""
+        try:
+            response = requests.delete(f"https://stablehorde.net/api/v2/generate/status/{job_id}", headers={"apikey": api_key})
+            response.raise_for_status()
+            print(f"Cancelled AI Horde job {job_id}")
+        except requests.exceptions.RequestException as e:
+            print(f"Warning: Failed to cancel AI Horde job {job_id}: {e}")
+
+        if self.journal:
+            self.journal.update(job_id, JobJournal.CANCELLED)
 
     def _download_and_save_image(self, image_url: str, prompt: str) -> str:
         print(f"Downloading image from: {image_url}")
@@ -77,11 +137,12 @@ class Image:
         image_response.raise_for_status()
         
         # Generate filename based on prompt
-        safe_filename = urlify(prompt[:50]) + ".png"  # Limit filename length
-        image_path = self.path + f"{safe_filename}"
+        # Prompts share a long common prefix, so the scenery title and mode keep concurrent downloads apart
+        safe_filename = urlify(prompt[:50] + self._journal_title()) + ".png"  # Limit filename length
+        image_path = path.join(self.directory, safe_filename)
         
         # Ensure images directory exists
-        makedirs(self.path, exist_ok=True)
+        makedirs(self.directory, exist_ok=True)
         
         with open(image_path, 'wb') as f:
             f.write(image_response.content)
@@ -89,6 +150,73 @@ class Image:
         print(f"Image saved to: {image_path}")
         return image_path
 
+    def _submit_aihorde_job(self, from_text: str) -> str:
+        """Submit a generation request to AI Horde and record it in the job journal."""
+        api_url = "https://stablehorde.net/api/v2/generate/async"
+
+        # Create request payload and headers
+        payload = self._create_aihorde_payload(from_text)
+        headers = {
+            "apikey": self.aihorde_api_key,
+            "Content-Type": "application/json"
+        }
+        
+        # Submit the generation request
+        response = requests.post(api_url, json=payload, headers=headers)
+        response.raise_for_status()
+        
+        result = response.json()
+        job_id = result.get("id")
+        
+        if not job_id:
+            raise ImageGenerationException(
+                "Failed to get job ID from AI Horde",
+                prompt=from_text[:100] + "...",
+                details={"api_response": result}
+            )
+
+        if self.journal:
+            self.journal.record(self._journal_title(), from_text, job_id)
+
+        return job_id
+
+    def _journal_title(self) -> str:
+        return JobJournal.title(self.title, self.mode)
+
+    def _resume_or_submit_aihorde_job(self, from_text: str) -> str:
+        """Resume polling an unfinished job from the journal, or submit a new one, and wait for it to complete."""
+        entry = self.journal.find_unfinished(self._journal_title(), from_text) if self.journal else None
+
+        if entry:
+            job_id = entry["job_id"]
+            print(f"Resuming AI Horde job {job_id} for scenery: {self.title}")
+            try:
+                job_id = self._poll_aihorde_job_completion(job_id, self.aihorde_api_key, from_text)
+                self.journal.update(job_id, JobJournal.DONE)
+                return job_id
+            except requests.exceptions.HTTPError as e:
+                # AI Horde forgets jobs some time after they finish, such jobs cannot be resumed
+                if e.response is None or e.response.status_code != 404:
+                    raise
+                print(f"AI Horde job {job_id} has expired, submitting a new one")
+                self.journal.update(job_id, JobJournal.EXPIRED)
+            except ImageGenerationException:
+                self.journal.update(job_id, JobJournal.FAULTED)
+                raise
+
+        job_id = self._submit_aihorde_job(from_text)
+        try:
+            job_id = self._poll_aihorde_job_completion(job_id, self.aihorde_api_key, from_text)
+        except ImageGenerationException:
+            if self.journal:
+                self.journal.update(job_id, JobJournal.FAULTED)
+            raise
+
+        if self.journal:
+            self.journal.update(job_id, JobJournal.DONE)
+
+        return job_id
+
     def _generate_image_with_aihorde(self, from_text: str) -> str:
         if not self.aihorde_api_key:
             raise ConfigurationException(
@@ -97,32 +225,8 @@ class Image:
                 details={"solution": "Create an API key from AI Horde and set it in your .env file"}
             )
         
-        api_url = "https://stablehorde.net/api/v2/generate/async"
-        
         try:
-            # Create request payload and headers
-            payload = self._create_aihorde_payload(from_text)
-            headers = {
-                "apikey": self.aihorde_api_key,
-                "Content-Type": "application/json"
-            }
-            
-            # Submit the generation request
-            response = requests.post(api_url, json=payload, headers=headers)
-            response.raise_for_status()
-            
-            result = response.json()
-            job_id = result.get("id")
-            
-            if not job_id:
-                raise ImageGenerationException(
-                    "Failed to get job ID from AI Horde",
-                    prompt=from_text[:100] + "...",
-                    details={"api_response": result}
-                )
-            
-            # Poll for completion
-            self._poll_aihorde_job_completion(job_id, self.aihorde_api_key, from_text)
+            job_id = self._resume_or_submit_aihorde_job(from_text)
             
             # Get the generated image URL
             status_url = f"https://stablehorde.net/api/v2/generate/status/{job_id}"
@@ -147,7 +251,11 @@ class Image:
                 )
             
             # Download and save the image
-            return self._download_and_save_image(image_url, from_text)
+            image_path = self._download_and_save_image(image_url, from_text)
+            if self.journal:
+                self.journal.update(job_id, JobJournal.DOWNLOADED)
+
+            return image_path
             
         except (requests.exceptions.RequestException, KeyError, ValueError) as e:
             raise ImageGenerationException(
@@ -165,7 +273,23 @@ class Image:
                 details={"error": str(e), "method": "aihorde"}
             )        
 
-    def create(self):
+    def create(self, scheduler: GenerationScheduler = None):
+        if scheduler:
+            self.scheduler = scheduler
+            self.mode = scheduler.mode
+            self.picked_profile = scheduler.pick_profile()
+
+        # Adjusted on a copy, so that calls without a scheduler start from the same profile every time
+        self.profile = dict(self.picked_profile)
+        if self.upscale_to:
+            self.profile["width"], self.profile["height"] = generation_size(self.profile["width"], self.profile["height"], self.upscale_to)
+            self.width, self.height = self.upscale_to
+        else:
+            self.width = self.profile["width"]
+            self.height = self.profile["height"]
+
+        self.reused_from = None
+
         if not self.t2i_url:
             raise ConfigurationException(
                 "TEXT_TO_IMAGE_URL is not set. Please configure it to use Stable Diffusion.",
@@ -184,17 +308,23 @@ class Image:
             # Use the title to create a better filename
             if self.title:
                 scenery_title = urlify(self.title.replace(" ", '').translate(str.maketrans('', '', punctuation)))
-                new_image_path = f"./output/images/{scenery_title}.png"
+                # Drafts are kept next to the final image rather than replacing it
+                if self.mode != "final":
+                    scenery_title = f"{scenery_title}_{self.mode}"
+                new_image_path = path.join(self.directory, f"{scenery_title}.png")
                 
                 # Rename the file to use the title
                 import os
                 if os.path.exists(image_path):
-                    os.rename(image_path, new_image_path)
+                    os.replace(image_path, new_image_path)
                     self.path = new_image_path
                 else:
                     self.path = image_path
             else:
                 self.path = image_path
+
+            if self.upscale_to:
+                upscale_image(self.path, self.upscale_to)
                 
             return self.path
             
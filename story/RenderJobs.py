@@ -0,0 +1,49 @@
+from os import path
+
+from story.Audio import Audio
+from story.AudioPostProcessor import AudioPostProcessor
+from story.Video import Video
+
+'''
+Note: Render jobs for utils.RenderQueue. Each runs in a worker process from plain parameters, as the story objects
+themselves hold connections and threads that cannot be sent there, and returns a JSON serializable result that
+IStory.use_video_result() / use_audio_result() apply back to the story.
+'''
+
+def render_video(params: dict, progress=None) -> dict:
+    """params as returned by video_job() of a story."""
+    quality = params.get("quality", "final")
+    video = Video(file_path="./output/videos/", file_name=params["name"] + ".mp4")
+    video_path = video.generate(
+        name=params["name"],
+        audio_path=params["audio_path"],
+        image_paths=params["image_paths"],
+        durations=params.get("durations"),
+        renditions=params.get("renditions"),
+        progress=progress,
+        quality=quality
+    )
+    if quality == "preview":
+        # A preview is only watched to check the pacing, it goes without captions
+        return {"quality": quality, "path": video_path}
+
+    video.add_subtitles(params.get("timings", []), params.get("english_text", ""))
+    return {"quality": quality, "path": video.path, "renditions": video.renditions, "subtitles": video.subtitles}
+
+def render_audio(params: dict, progress=None) -> dict:
+    """params as returned by audio_job() of a story."""
+    steps = 2 if params.get("post_process") else 1
+    if progress:
+        progress(0, steps, "steps")
+
+    audio = Audio(file_path=path.dirname(params["path"]) + "/", file_name=path.basename(params["path"]))
+    audio.generate(text=params["text"], intro=params.get("intro"), outro=params.get("outro"), lib=params["lib"])
+    if progress:
+        progress(1, steps, "steps")
+
+    if params.get("post_process"):
+        AudioPostProcessor().process(audio)
+        if progress:
+            progress(2, steps, "steps")
+
+    return {"path": audio.path, "duration": audio.duration, "timings": audio.timings, "timings_path": audio.timings_path}
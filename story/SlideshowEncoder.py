@@ -0,0 +1,254 @@
+import itertools, os, subprocess, tempfile
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+from os import cpu_count, getenv
+
+from exceptions import VideoGenerationException
+from utils.Ffmpeg import pipe_ffmpeg, run_ffmpeg
+from utils.Motion import MOTION_EFFECTS, motion_frames
+from utils.SegmentCache import SegmentCache
+from utils.Transitions import crossfade_frames, transition_frames
+
+class SlideshowEncoder:
+    """
+    Encodes a still image slideshow by driving ffmpeg directly.
+
+    The frames stream in already prepared as raw RGB24 buffers, one per scene. Every
+    scene is encoded into its own segment per rendition. For a still scene ffmpeg
+    scales the single frame once and repeats it with the loop filter. A scene with
+    a pan/zoom effect gets its frames from utils.Motion as ffmpeg consumes them.
+    The renditions of a scene are split in one filter graph, so each frame is piped
+    only once. With a transition, the frames around every cut are blended and
+    piped at the start of the incoming scene, in the same ffmpeg run, and the
+    rest of the scene stays still.
+
+    Segments are kept in a SegmentCache, and unchanged scenes are not encoded
+    again. The missing segments are encoded in parallel, each scene in its own
+    ffmpeg process, and a frame is released as soon as its scene is encoded, so
+    memory does not grow with the length of the story. Every rendition is then
+    joined from its segments by stream copy, with the narration muxed in.
+    """
+    def __init__(self, size: tuple = (800, 600), fps: int = 24, preset: str = "veryfast", crf: int = 23, fit: str = "letterbox",
+                 cache: SegmentCache = None, transition: str = "none", transition_duration: float = 0.5):
+        self.size = size  # Size of the frames piped in
+        self.fps = fps
+        self.preset = preset
+        self.crf = crf
+        self.fit = fit
+        self.cache = cache or SegmentCache()
+        self.transition = transition
+        self.transition_frames = transition_frames(transition, transition_duration, fps)
+        # Scenes encoded at the same time, each in its own ffmpeg process
+        self.workers = max(1, int(getenv('VIDEO_ENCODE_WORKERS', cpu_count() or 1)))
+
+    def _resize_filter(self, size: tuple) -> str:
+        width, height = size
+        if tuple(size) == tuple(self.size):
+            return "null"
+        if self.fit == "crop":
+            return f"scale={width}:{height}:force_original_aspect_ratio=increase:flags=lanczos,crop={width}:{height}"
+        return f"scale={width}:{height}:force_original_aspect_ratio=decrease:flags=lanczos,pad={width}:{height}:(ow-iw)/2:(oh-ih)/2"
+
+    def _profile(self, size: tuple, moving: bool) -> dict:
+        """Every encoder setting that changes a segment. Segments joined by stream copy must share it."""
+        return {
+            "codec": "libx264", "preset": self.preset, "crf": self.crf, "fps": self.fps,
+            "tune": None if moving else "stillimage", "source_size": list(self.size), "size": list(size), "fit": self.fit
+        }
+
+    def _encode_segment(self, source, frame_count: int, segments: list, moving: bool, threads: int, loop_start: int = None) -> None:
+        """
+        Encode frame_count frames into the segments, a list of (cache key, (width, height)) pairs. source is either
+        a still frame, or a function that returns the frames as they are needed. With loop_start, the frame at that
+        index is the last one piped and ffmpeg repeats it up to frame_count.
+        """
+        width, height = self.size
+        args = ["-f", "rawvideo", "-pix_fmt", "rgb24", "-s", f"{width}x{height}", "-framerate", str(self.fps), "-i", "pipe:0"]
+
+        # A still frame is piped once, scaled once per rendition and then repeated. The loop filter counts a frame
+        # before comparing against start, so start is one past the index of the frame to repeat.
+        repeat = f",loop=loop={frame_count - loop_start - 1}:size=1:start={loop_start + 1}" if loop_start is not None else ""
+        graph = [f"[0:v]split={len(segments)}" + "".join(f"[s{index}]" for index in range(len(segments)))]
+        for index, (_, size) in enumerate(segments):
+            graph.append(f"[s{index}]{self._resize_filter(size)}{repeat},setsar=1,format=yuv420p[v{index}]")
+        args += ["-filter_complex", ";".join(graph)]
+
+        # Only a video made entirely of still scenes benefits from the stillimage tuning
+        tune = [] if moving else ["-tune", "stillimage"]
+        partial_paths = [self.cache.partial_path(key) for key, _ in segments]
+        for index, partial_path in enumerate(partial_paths):
+            args += [
+                "-map", f"[v{index}]", "-frames:v", str(frame_count),
+                "-c:v", "libx264", "-preset", self.preset, "-crf", str(self.crf), "-threads", str(threads)
+            ] + tune + ["-f", "mp4", partial_path]
+
+        if isinstance(source, bytes):
+            run_ffmpeg(args, input=source)
+        else:
+            pipe_ffmpeg(args, source())
+
+        for (key, _), partial_path in zip(segments, partial_paths):
+            self.cache.commit(key, partial_path)
+
+    def _scene_segment(self, scene: tuple, head: int, tail: int, previous: tuple = None, previous_tail: int = 0) -> tuple:
+        """
+        Segment of a scene without its last tail frames, which go to the transition into the next scene. After a
+        previous scene the segment opens with the transition into this one, blending the last previous_tail frames
+        of the previous scene with the first head frames of this one, so a cut costs no ffmpeg run of its own.
+        """
+        frame, frame_hash, frame_count, effect = scene
+        still = MOTION_EFFECTS[effect] is None
+        body = frame_count - head - tail
+        window = [head, frame_count - tail] if head or tail else None
+        scene_frames = lambda: motion_frames(frame, self.size, effect, frame_count, head, frame_count - tail)
+
+        if not previous or not previous_tail + head:
+            if still:
+                return (frame_hash, frame_count, effect, window, None), body, frame, 0
+            return (frame_hash, frame_count, effect, window, None), body, scene_frames, None
+
+        previous_frame, previous_hash, previous_count, previous_effect = previous
+        incoming = [self.transition, previous_hash, previous_count, previous_effect, previous_tail]
+        blend = lambda: crossfade_frames(
+            (previous_frame, previous_effect, previous_count), (frame, effect, frame_count), self.size, previous_tail, head
+        )
+        length = previous_tail + head
+        if still:
+            # The blended frames and then the still frame once, which ffmpeg repeats
+            source = lambda: itertools.chain(blend(), [frame] if body > 0 else [])
+            return (frame_hash, frame_count, effect, window, incoming), length + body, source, length if body > 0 else None
+        source = lambda: itertools.chain(blend(), scene_frames())
+        return (frame_hash, frame_count, effect, window, incoming), length + body, source, None
+
+    def _segments(self, scenes, effects: list):
+        """
+        Yield the segments of the video in order, as (cache key material, frame count, source, loop start). Every
+        transition takes half of its frames from each of the scenes around the cut, and is encoded at the start
+        of the segment of the incoming scene.
+        """
+        previous, head = None, 0
+        before, before_tail = None, 0
+        elapsed, frames_before = 0.0, 0
+        for index, (frame, duration) in enumerate(scenes):
+            # Rounded on the cumulative timeline so that rounding errors do not add up
+            elapsed += duration
+            frame_count = int(round(elapsed * self.fps)) - frames_before
+            frames_before += frame_count
+            if frame_count <= 0:
+                continue
+
+            effect = effects[index] if index < len(effects) else "none"
+            scene = (frame, SegmentCache.frame_hash(frame), frame_count, effect)
+            if previous is None:
+                previous = scene
+                continue
+
+            # A scene gives at most half of its frames to each of its transitions
+            tail = min(self.transition_frames - self.transition_frames // 2, previous[2] // 2)
+            next_head = min(self.transition_frames // 2, frame_count // 2)
+            yield self._scene_segment(previous, head, tail, before, before_tail)
+            before, before_tail = previous, tail
+            previous, head = scene, next_head
+
+        if previous:
+            yield self._scene_segment(previous, head, 0, before, before_tail)
+
+    def _concat(self, segment_paths: list, audio_path: str, output_path: str) -> None:
+        with tempfile.NamedTemporaryFile("w", suffix=".ffconcat", delete=False, encoding="utf-8") as concat_file:
+            concat_file.write("ffconcat version 1.0\n")
+            for segment_path in segment_paths:
+                escaped = segment_path.replace("'", "'\\''")
+                concat_file.write(f"file '{escaped}'\n")
+
+        args = ["-f", "concat", "-safe", "0", "-i", concat_file.name]
+        if audio_path:
+            args += ["-i", audio_path]
+        args += ["-map", "0:v", "-c:v", "copy"]
+        if audio_path:
+            args += ["-map", "1:a", "-c:a", "aac", "-b:a", "128k", "-shortest"]
+        args += ["-movflags", "+faststart", output_path]
+
+        try:
+            run_ffmpeg(args)
+        finally:
+            os.remove(concat_file.name)
+
+    def encode(self, scenes, audio_path: str, outputs: list, effects: list = None, progress=None, duration: float = None) -> list:
+        """
+        Encode scenes, an iterable of (frame, duration) pairs with the frame as raw RGB24 bytes of self.size and
+        the duration in seconds. Scenes are consumed as they are encoded, so only the scenes being encoded are held.
+        outputs is a list of (output_path, (width, height)) pairs, one per rendition.
+        effects optionally names the utils.Motion effect of every scene.
+        progress, if given, is called with the frames done so far and the frames of all renditions, cached
+        segments counting as done. duration, the total of the scene durations, lets it know the total up front.
+        """
+        effects = effects or []
+        moving = any(MOTION_EFFECTS[effect] for effect in effects)
+        segments = {output_path: [] for output_path, _ in outputs}
+
+        frames_total = int(round((duration or 0) * self.fps)) * len(outputs)
+        frames_done = 0
+        if progress:
+            progress(frames_done, frames_total)
+
+        def report(frame_count: int) -> None:
+            nonlocal frames_done
+            frames_done += frame_count
+            if progress:
+                progress(frames_done, max(frames_total, frames_done))
+
+        encoded = 0
+        # Other renders sharing the cache must not evict the segments of this one while it runs
+        hold = self.cache.hold()
+        try:
+            # The encoding happens in the ffmpeg processes and PIL resamples without the GIL, so threads are enough
+            # to keep them fed. Every ffmpeg process gets its share of the cores, all with the same settings.
+            threads = max(1, (cpu_count() or 1) // self.workers)
+            scheduled, pending = set(), {}
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                for (frame_hash, frame_count, effect, window, incoming), segment_frames, source, loop_start in self._segments(scenes, effects):
+                    if segment_frames <= 0:
+                        continue
+
+                    missing = []
+                    for output_path, size in outputs:
+                        key = SegmentCache.key(frame_hash, frame_count, effect, self._profile(size, moving), window, incoming)
+                        segments[output_path].append(self.cache.path(key))
+                        self.cache.add_to_hold(hold, self.cache.path(key))
+                        # A scene repeated with the same image and length is encoded once
+                        if key not in scheduled and not self.cache.get(key):
+                            scheduled.add(key)
+                            missing.append((key, size))
+
+                    report(segment_frames * (len(outputs) - len(missing)))
+                    if not missing:
+                        continue
+
+                    # Wait for a free encoder before taking the next frame, it is released once its segment is encoded
+                    while len(pending) >= self.workers:
+                        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            future.result()
+                            encoded += 1
+                            report(pending.pop(future))
+                    future = pool.submit(self._encode_segment, source, segment_frames, missing, moving, threads, loop_start)
+                    pending[future] = segment_frames * len(missing)
+
+                for future in as_completed(pending):
+                    future.result()
+                    encoded += 1
+                    report(pending[future])
+
+            print(f"Encoded {len(scheduled)} of {sum(len(paths) for paths in segments.values())} segments in {encoded} runs of ffmpeg, {self.workers} at a time")
+            for output_path, _ in outputs:
+                self._concat(segments[output_path], audio_path, output_path)
+        except subprocess.CalledProcessError as e:
+            raise VideoGenerationException(
+                "ffmpeg failed to encode the slideshow",
+                method="ffmpeg",
+                details={"error": e.stderr, "outputs": [output_path for output_path, _ in outputs]}
+            )
+        finally:
+            self.cache.release(hold)
+
+        self.cache.evict(keep=[segment_path for paths in segments.values() for segment_path in paths])
+        return [output_path for output_path, _ in outputs]
@@ -1,4 +1,4 @@
-import ast, datetime, dotenv, itertools, requests
+import ast, datetime, dotenv, itertools, requests, shutil, threading
 
 from langchain.chains import LLMChain
 from langchain.prompts import PromptTemplate
@@ -27,11 +27,18 @@ from publishers.IPublisher import IPublisher
 from story.IStory import IStory
 from story.Audio import Audio
 from story.Image import Image
+from story.RenderJobs import render_audio, render_video
 from story.Text import Text
 from story.Video import Video
 
 from utils.conclusion import conclusion
 from utils.introduction import introduction
+from utils.GenerationScheduler import GenerationScheduler
+from utils.HedgePolicy import HedgePolicy
+from utils.ImageArrivals import ImageArrivals
+from utils.JobJournal import JobJournal
+from utils.SceneryIndex import SceneryIndex
+from utils.SceneTiming import load_timings, scene_durations_for
 from utils.Utils import make_api_request, urlify
 
 dotenv.load_dotenv()
@@ -74,6 +81,9 @@ class Story(IStory):
             }
         )
         self.images: List[Image] = []  # Initialize as an empty list to store Image objects
+        self.journal = JobJournal()  # Survives restarts so that submitted AI Horde jobs are not lost
+        self.hedge_policy = HedgePolicy.from_env()  # One policy per story, so the extra submissions cap is per story
+        self.scenery_index = SceneryIndex(threshold=float(getenv('SCENERY_REUSE_THRESHOLD', 0.75)))
 
     def get_text(self, language: str = "Hindi") -> None:
         self.texts[language].get(self.url)
@@ -156,7 +166,7 @@ class Story(IStory):
                 print(f"Description: {value.get('description', '')}")
                 print(f"Sentiments: {value.get('adjectives', [])}")
 
-                image = Image(title=key, path="./output/images/", description=value.get("description", ""), sentiments=value.get("adjectives", []))
+                image = Image(title=key, path="./output/images/", description=value.get("description", ""), sentiments=value.get("adjectives", []), journal=self.journal, hedge_policy=self.hedge_policy)
                 image.width = 512
                 image.height = 512
                 self.images.append(image)
@@ -171,10 +181,47 @@ class Story(IStory):
                 details={"error": str(e), "story_length": len(self.texts["English"].content) if self.texts["English"].content else 0}
             )
 
-    def get_images(self, count: int = 1) -> None:
+    def get_images(self, count: int = 1, mode: str = "final", background: bool = False, reuse: bool = True, on_image=None, cancelled=None):
+        """
+        Generate images for all sceneries.
+
+        The mode selects the generation profiles, "draft" for quick previews and "final" for
+        the images used in the video. With background set the images are generated on a
+        separate thread, which is returned so that the caller can check on it. With reuse set,
+        a final image is not generated when a similar scenery from an earlier story already has one.
+        on_image(index, ok) is called as soon as the image of every scenery is done. cancelled(), if given,
+        is checked before every image, and no further images are generated once it returns True.
+        """
+        if background:
+            kwargs = {"count": count, "mode": mode, "reuse": reuse, "on_image": on_image, "cancelled": cancelled}
+            thread = threading.Thread(target=self.get_images, kwargs=kwargs, daemon=True)
+            thread.start()
+            return thread
+
+        # Jobs left unfinished by an earlier run are picked up again by Image.create() instead of being resubmitted
+        unfinished = self.journal.unfinished(titles={JobJournal.title(image.title, mode) for image in self.images})
+        if unfinished:
+            print(f"Found {len(unfinished)} unfinished AI Horde job(s) for these sceneries from an earlier run, resuming them")
+
+        # One scheduler per call, so that queue observations from earlier images inform the later ones
+        scheduler = GenerationScheduler(mode=mode)
+
         try:
-            for image in self.images:
-                image.create()
+            for index, image in enumerate(self.images):
+                if cancelled and cancelled():
+                    print(f"Image generation cancelled after {index} of {len(self.images)} images")
+                    break
+
+                if mode == "final" and reuse and self._reuse_image(image):
+                    if on_image:
+                        on_image(index, True)
+                    continue
+
+                image.create(scheduler=scheduler)
+                if mode == "final":
+                    self.scenery_index.add(image.title, image.description, image.sentiments, image.path)
+                if on_image:
+                    on_image(index, bool(image.path))
         except (ConfigurationException, ImageGenerationException) as e:
             if "TEXT_TO_IMAGE_URL is not set" in str(e):
                 raise ConfigurationException(
@@ -193,14 +240,56 @@ class Story(IStory):
                 details={"error": str(e), "image_count": len(self.images)}
             )
             
+    def _reuse_image(self, image: Image) -> bool:
+        own_path = f"./output/images/{image.title}.png"
+        # An image of this story's own is never replaced by another story's
+        if path.exists(own_path):
+            return False
+
+        match, similarity = self.scenery_index.find(image.title, image.description, image.sentiments, exclude_path=own_path)
+        if not match:
+            return False
+
+        # get_video() looks images up by scenery title, so the reused image is copied under this scenery's name
+        print(f"Reusing image of scenery {match['title']} for {image.title} (similarity {similarity:.2f})")
+        shutil.copyfile(match["path"], own_path)
+        image.path = own_path
+        image.reused_from = match["title"]
+        self.scenery_index.add(image.title, image.description, image.sentiments, own_path)
+        return True
+
+    def audio_job(self, lib: str) -> dict:
+        """Parameters of story.RenderJobs.render_audio() for the narration of this story."""
+        extension = ".mp3" if lib.lower() == "gtts" else ".wav"
+        return {
+            "path": "./output/audios/" + self.name + extension,
+            "text": self.texts["Hindi"].content,
+            "intro": introduction.get("Hindi"),
+            "outro": conclusion.get("Hindi"),
+            "lib": lib,
+            # Trim silences, normalize loudness and mix the music bed before the audio goes into the video
+            "post_process": getenv('AUDIO_POST_PROCESS', 'true').lower() == 'true'
+        }
+
+    def use_audio_result(self, result: dict) -> str:
+        """Take over the narration rendered by story.RenderJobs.render_audio()."""
+        if self.audio is None:
+            self.audio = Audio(file_path="./output/audios/", file_name=path.basename(result["path"]))
+        self.audio.path = result["path"]
+        self.audio.duration = result["duration"]
+        self.audio.timings = result["timings"]
+        self.audio.timings_path = result["timings_path"]
+        return self.audio.path
+
     def get_audio(self, lib: str) -> str:
         print("Beginning to process audio...")
-        final_text = introduction.get("Hindi") + "\n\n" + self.texts["Hindi"].content + "\n\n" + conclusion.get("Hindi") + "\n\n"
-        self.audio.generate(text=final_text, name=self.name, lib=lib)
-        return self.audio.path
+        return self.use_audio_result(render_audio(self.audio_job(lib)))
 
-    def get_video(self) -> str:
-        print("Beginning to process video...")
+    def video_job(self, check_images: bool = True, quality: str = "final") -> dict:
+        """
+        Parameters of story.RenderJobs.render_video() for the video of this story. check_images is turned off
+        when the images are still being generated. quality is one of story.Video.VIDEO_QUALITIES.
+        """
         # Use the CamelCase scenery titles directly for image paths, but only if files exist
         image_paths = []
         for key in self.sceneries.keys():
@@ -208,16 +297,88 @@ class Story(IStory):
             if path.exists(image_path):
                 image_paths.append(image_path)
         
-        if not image_paths:
+        if check_images and not image_paths:
             raise VideoGenerationException(
                 "No images found for video generation",
                 details={"expected_images": list(self.sceneries.keys())}
             )
-        
-        self.video.generate(name=self.name, audio_path=self.audio.path, image_paths=image_paths)
+
+        # Every scenery is passed with its narration-aligned duration, Video folds those without an image into the scene before
+        return {
+            "name": self.name,
+            "audio_path": self.audio.path if self.audio else None,
+            "image_paths": [f"./output/images/{key}.png" for key in self.sceneries.keys()],
+            "durations": scene_durations_for(self.audio, [value.get("description", "") for value in self.sceneries.values()], self.texts["English"].content),
+            "timings": load_timings(self.audio),
+            "english_text": self.texts["English"].content,
+            "quality": quality
+        }
+
+    def use_video_result(self, result: dict) -> str:
+        """Take over the video rendered by story.RenderJobs.render_video()."""
+        if self.video is None:
+            self.video = Video(file_path="./output/videos/", file_name=self.name + ".mp4")
+        if result.get("quality") == "preview":
+            self.video.preview_path = result["path"]
+            return self.video.preview_path
+
+        self.video.path = result["path"]
+        self.video.renditions = result["renditions"]
+        self.video.subtitles = result["subtitles"]
+        return self.video.path
+
+    def get_video(self, quality: str = "final") -> str:
+        """Render the video, or with quality "preview" a quick low resolution preview of it, see story.Video.VIDEO_QUALITIES."""
+        print(f"Beginning to process video ({quality})...")
+        return self.use_video_result(render_video(self.video_job(quality=quality)))
+
+    def get_images_and_video(self) -> str:
+        """
+        Generate the final images on a background thread and assemble the video while they arrive, encoding every
+        scene as soon as its image is in, so that little is left to do once the last image lands. The scene
+        durations follow the narration, so get_audio() goes first.
+        """
+        print("Beginning to process images and video...")
+        arrivals = ImageArrivals(len(self.images))
+
+        def generate_images():
+            try:
+                self.get_images(on_image=arrivals.arrived, cancelled=lambda: arrivals.closed)
+            except Exception as e:
+                print(f"Warning: Error generating images: {str(e)}. Continuing with the images generated so far...")
+            finally:
+                arrivals.finish()
+
+        thread = threading.Thread(target=generate_images, daemon=True)
+        thread.start()
+
+        try:
+            params = self.video_job(check_images=False)
+            if self.video is None:
+                self.video = Video(file_path="./output/videos/", file_name=self.name + ".mp4")
+            self.video.generate(
+                name=params["name"],
+                audio_path=params["audio_path"],
+                image_paths=params["image_paths"],
+                durations=params["durations"],
+                wait_for_image=arrivals.wait
+            )
+            self.video.add_subtitles(params["timings"], params["english_text"])
+        finally:
+            # Should the video fail, no more images are generated for it. Otherwise every image is in by now.
+            arrivals.close()
+            thread.join()
+
         return self.video.path
     
     def publish(self, publishers: List[IPublisher]) -> None:
+        # Only a preview may have been rendered so far, the final video is rendered before the story goes out
+        if not (self.video and self.video.path and path.exists(self.video.path)):
+            try:
+                self.get_video()
+            except VideoGenerationException as e:
+                print(f"Warning: Failed to render the final video, publishing without it: {str(e)}")
+
         # Prepare content for publishing
         content = {
             "text": {
@@ -226,7 +387,8 @@ class Story(IStory):
                 "title": self.texts.get("Hindi", Text("Hindi")).title if hasattr(self, 'texts') else "Story"
             },
             "audios": [self.audio.path] if hasattr(self, 'audio') and self.audio.path else [],
-            "videos": [self.video.path] if hasattr(self, 'video') and self.video.path else [],
+            "videos": [self.video.path] if hasattr(self, 'video') and self.video and self.video.path else [],
+            "renditions": dict(self.video.renditions) if hasattr(self, 'video') and self.video else {},
             "images": [img.path for img in getattr(self, 'images', []) if hasattr(img, 'path') and img.path] if hasattr(self, 'images') else []
         }
         
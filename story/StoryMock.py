@@ -7,9 +7,11 @@ from story.IStory import IStory
 from story.Text import Text
 from story.Audio import Audio
 from story.Video import Video
+from story.RenderJobs import render_audio, render_video
 from story.Story import Story # Used in get_images()
 from publishers.IPublisher import IPublisher
 from utils.mock.inputs import mock_sceneries, mock_text, mock_title
+from utils.SceneTiming import load_timings, scene_durations_for
 from utils.Utils import urlify
 
 class StoryMock(IStory):
@@ -35,8 +37,8 @@ class StoryMock(IStory):
         }
         self.sceneries = mock_sceneries
         # Don't hardcode audio path - let it be generated when needed
-        self.audio = Audio(file_path="./output/audios/", file_name="mock_story" + "_" + str(self.id))
-        # self.video = Video()
+        self.audio = Audio(file_path="./output/audios/", file_name="mock_story" + "_" + str(self.id) + ".mp3")
+        self.video = Video(file_path="./output/videos/", file_name="mock_story" + "_" + str(self.id) + ".mp4")
 
     def get_text(self):
         self.story_name = self.texts["Hindi"].title.replace(" ", '').translate(str.maketrans('', '', punctuation))
@@ -102,46 +104,56 @@ class StoryMock(IStory):
 
         return
 
-    def get_video(self):
+    def video_job(self, quality: str = "final") -> dict:
+        # Ensure we have audio first
+        if not self.audio.path or not path.exists(self.audio.path):
+            # Generate audio first if it doesn't exist
+            self.get_audio('gTTS')
+        
+        # Ensure we have images
+        self.get_images()  # Always call get_images to ensure mapping is done
+        
+        # If no images are available, we can't create a video
+        if not any(scenery.get("path") and path.exists(scenery["path"]) for scenery in self.sceneries.values()):
+            from exceptions import VideoGenerationException
+            raise VideoGenerationException(
+                "No images available for video generation",
+                method="mock",
+                details={"sceneries": list(self.sceneries.keys())}
+            )
+        
+        # Every scenery is passed with its narration-aligned duration, Video folds those without an image into the scene before
+        descriptions = [scenery.get("description", "") for scenery in self.sceneries.values()]
+        return {
+            # Use a proper name for the mock video
+            "name": f"{self.story_name}_{self.id}" if self.story_name else f"mock_story_{self.id}",
+            "audio_path": self.audio.path,
+            "image_paths": [scenery.get("path") or "" for scenery in self.sceneries.values()],
+            "durations": scene_durations_for(self.audio, descriptions, self.texts["English"].content),
+            "timings": load_timings(self.audio),
+            "english_text": self.texts["English"].content,
+            "quality": quality
+        }
+
+    def use_video_result(self, result: dict) -> str:
+        if result.get("quality") == "preview":
+            self.video.preview_path = result["path"]
+            return self.video.preview_path
+
+        self.video.path = result["path"]
+        self.video.renditions = result["renditions"]
+        self.video.subtitles = result["subtitles"]
+        return self.video.path
+
+    def get_video(self, quality: str = "final"):
         # Check if video already exists and is valid
-        if self.video.path and path.exists(self.video.path):
-            return self.video.path
+        existing = self.video.preview_path if quality == "preview" else self.video.path
+        if existing and path.exists(existing):
+            return existing
             
         # Generate video if it doesn't exist
         try:
-            # Ensure we have audio first
-            if not self.audio.path or not path.exists(self.audio.path):
-                # Generate audio first if it doesn't exist
-                self.get_audio('gTTS')
-            
-            # Ensure we have images
-            self.get_images()  # Always call get_images to ensure mapping is done
-            
-            # Collect available image paths
-            image_paths = []
-            for key, scenery in self.sceneries.items():
-                if scenery.get("path") and path.exists(scenery["path"]):
-                    image_paths.append(scenery["path"])
-            
-            # If no images are available, we can't create a video
-            if not image_paths:
-                from exceptions import VideoGenerationException
-                raise VideoGenerationException(
-                    "No images available for video generation",
-                    method="mock",
-                    details={"sceneries": list(self.sceneries.keys())}
-                )
-            
-            # Use a proper name for the mock video
-            video_name = f"{self.name}_{self.id}" if self.name else f"mock_story_{self.id}"
-            
-            self.video.generate(
-                name=video_name,
-                audio_path=self.audio.path,
-                image_paths=image_paths
-            )
-            
-            return self.video.path
+            return self.use_video_result(render_video(self.video_job(quality=quality)))
             
         except Exception as e:
             # Import the exception here to avoid circular imports
@@ -155,6 +167,30 @@ class StoryMock(IStory):
                     details={"story_id": self.id, "error": str(e)}
                 )
 
+    def get_images_and_video(self):
+        # Mock images are already on disk, there is nothing to wait for
+        return self.get_video()
+
+    def audio_job(self, tts_engine: str) -> dict:
+        from utils.introduction import introduction
+        from utils.conclusion import conclusion
+
+        return {
+            "path": path.join(self.audio.file_path, self.audio.file_name),
+            "text": self.texts["Hindi"].content,
+            "intro": introduction.get("Hindi"),
+            "outro": conclusion.get("Hindi"),
+            "lib": tts_engine,
+            "post_process": False
+        }
+
+    def use_audio_result(self, result: dict) -> str:
+        self.audio.path = result["path"]
+        self.audio.duration = result["duration"]
+        self.audio.timings = result["timings"]
+        self.audio.timings_path = result["timings_path"]
+        return self.audio.path
+
     def get_audio(self, tts_engine: str):
         # Check if audio already exists and is valid
         if self.audio.path and path.exists(self.audio.path):
@@ -162,17 +198,7 @@ class StoryMock(IStory):
             
         # Generate audio if it doesn't exist
         try:
-            from utils.introduction import introduction
-            from utils.conclusion import conclusion
-            
-            final_text = introduction.get("Hindi") + "\n\n" + self.texts["Hindi"].content + "\n\n" + conclusion.get("Hindi") + "\n\n"
-            
-            # Use a proper name for the mock story
-            audio_name = f"{self.name}_{self.id}" if self.name else f"mock_story_{self.id}"
-            
-            self.audio.generate(text=final_text, name=audio_name, lib=tts_engine)
-            
-            return self.audio.path
+            return self.use_audio_result(render_audio(self.audio_job(tts_engine)))
         except Exception as e:
             # Import the exception here to avoid circular imports
             from exceptions import AudioGenerationException
@@ -186,6 +212,13 @@ class StoryMock(IStory):
         self.sceneries = mock_sceneries
 
     def publish(self, publishers: List[IPublisher]) -> None:
+        # Only a preview may have been rendered so far, the final video is rendered before the story goes out
+        if not (self.video.path and path.exists(self.video.path)):
+            try:
+                self.get_video()
+            except Exception as e:
+                print(f"Warning: Failed to render the final video, publishing without it: {str(e)}")
+
         # Prepare content for publishing
         content = {
             "text": {
@@ -193,8 +226,9 @@ class StoryMock(IStory):
                 "english": self.texts.get("English").content if self.texts.get("English") else "",
                 "title": self.texts.get("Hindi").title if self.texts.get("Hindi") else "Mock Story"
             },
-            "audio": self.audio.path if self.audio.path else None,
-            "video": self.video.path if self.video.path else None,
+            "audios": [self.audio.path] if self.audio.path else [],
+            "videos": [self.video.path] if self.video.path else [],
+            "renditions": dict(self.video.renditions),
             "images": [s.get("path") for s in self.sceneries.values() if s.get("path")] if hasattr(self, 'sceneries') else []
         }
         
@@ -1,24 +1,214 @@
 from exceptions import VideoGenerationException
-import os
-from moviepy.editor import ImageSequenceClip, AudioFileClip, ImageClip, concatenate_videoclips
+import os, subprocess
+import numpy as np
+from os import getenv
+from moviepy.editor import AudioFileClip, VideoClip
 from PIL import Image as PILImage
 
+from story.SlideshowEncoder import SlideshowEncoder
+from utils import MediaProbe, Subtitles
+from utils.Frames import peak_memory_mb, stream_frames
+from utils.Motion import scene_effects
+from utils.SegmentCache import SegmentCache
+
+# Output sizes of the story video. Publishers pick the rendition that matches their platform.
+VIDEO_RENDITIONS = {
+    "landscape": {"size": (1280, 720)},  # 16:9, YouTube, Facebook
+    "portrait": {"size": (720, 1280)},   # 9:16, Reels, Shorts, Threads
+    "square": {"size": (1080, 1080)},    # 1:1, Instagram feed
+    "classic": {"size": (800, 600)},     # 4:3, the original single output
+}
+
+# Encoder settings of the final video, and of a quick preview of the first rendition that only needs to show
+# the pacing and the order of the images before the story is published. Each quality caches its segments in a
+# directory of its own, with its share of the segment cache budget, so that previews never evict final segments.
+VIDEO_QUALITIES = {
+    "final": {"fps": 24, "preset": "veryfast", "crf": 23, "max_side": None,
+              "cache_dir": "./output/videos/.segments", "cache_share": 0.8},
+    "preview": {"fps": 8, "preset": "ultrafast", "crf": 30, "max_side": 480,
+                "cache_dir": "./output/videos/.segments/preview", "cache_share": 0.2},
+}
+
 class Video:
     def __init__(self, file_path: str, file_name: str):
         self.file_path = file_path
         self.file_name = file_name
+        self.path = None
+        self.preview_path = None
+        # "ffmpeg" encodes the slideshow in ffmpeg directly, "moviepy" composites every frame in Python
+        self.encoder = getenv('VIDEO_ENCODER', 'ffmpeg').lower()
+        self.renditions = {}
+        self.subtitles = {}
+        self.subtitles_enabled = getenv('VIDEO_SUBTITLES', 'true').lower() == 'true'
+        self.default_renditions = [rendition.strip() for rendition in getenv('VIDEO_RENDITIONS', 'landscape,portrait,square').split(',') if rendition.strip()]
+        # Ken Burns pan and zoom, "none", "auto" or one of utils.Motion.MOTION_EFFECTS
+        self.motion = getenv('VIDEO_MOTION', 'none').lower()
+        # "crossfade" blends the frames around every cut, "none" cuts from scene to scene
+        self.transition = getenv('VIDEO_TRANSITION', 'none').lower()
+        self.transition_duration = float(getenv('VIDEO_TRANSITION_SECONDS', 0.5))
+        # "letterbox" pads images of another aspect ratio with black bars, "crop" fills the frame
+        self.fit = getenv('VIDEO_FIT', 'letterbox').lower()
 
         if not self.file_path:
             os.makedirs(file_path, exist_ok=True)
 
-    def generate(self, name: str, video_path: str, image_paths: list):
+    @staticmethod
+    def _master_size(image_paths, sizes: list) -> tuple:
+        """Size of the first readable image, shrunk to the largest rendition so that frames are never bigger than needed."""
+        width, height = max(sizes)
+        for image_path in image_paths:
+            try:
+                with PILImage.open(image_path) as img:
+                    width, height = img.size
+                break
+            except Exception:
+                continue
+
+        scale = min(1.0, max(max(size) for size in sizes) / max(width, height))
+        return int(width * scale) // 2 * 2, int(height * scale) // 2 * 2
+
+    @staticmethod
+    def _preview_size(size: tuple, max_side: int) -> tuple:
+        """size shrunk so that its longer side is at most max_side, with even dimensions for yuv420p."""
+        scale = min(1.0, max_side / max(size))
+        return int(size[0] * scale) // 2 * 2, int(size[1] * scale) // 2 * 2
+
+    @staticmethod
+    def _fold_durations(kept: list, durations: list) -> list:
+        """Durations of the kept scenes, the time of every dropped scene going to the kept scene before it."""
+        folded, carried = [], 0.0
+        for keep, duration in zip(kept, durations):
+            if keep:
+                folded.append(duration)
+            elif folded:
+                folded[-1] += duration
+            else:
+                carried += duration  # Dropped before the first kept scene
+
+        if folded:
+            folded[0] += carried
+        return folded
+
+    @staticmethod
+    def _arriving(image_paths: list, wait_for_image):
+        """Yield image_paths in order, each once wait_for_image(index) returns, and None for an image that failed."""
+        for index, image_path in enumerate(image_paths):
+            yield image_path if wait_for_image(index) else None
+
+    @staticmethod
+    def _scenes(image_paths, durations: list, size: tuple, fit: str, max_workers: int = None):
+        """
+        Yield (frame, duration) for every image that can be read, decoding the images only as the scenes are consumed.
+        The time of an image that cannot be read goes to the scene before it, as in _fold_durations().
+        """
+        held, carried, attempted = None, 0.0, 0
+        for frame, duration in zip(stream_frames(image_paths, size, fit=fit, max_workers=max_workers), durations):
+            attempted += 1
+            if frame is None:
+                if held:
+                    held = (held[0], held[1] + duration)
+                else:
+                    carried += duration  # Dropped before the first readable image
+                continue
+
+            if held:
+                yield held
+            held, carried = (frame, duration + carried), 0.0
+
+        if held is None:
+            raise VideoGenerationException(
+                "Failed to process any images for video generation",
+                details={"attempted_images": attempted}
+            )
+        yield held
+
+    def _render_moviepy(self, scenes, duration: float, audio_path: str, fps: int, output_path: str, preset: str = "medium") -> None:
+        """scenes returns a new stream of (frame, duration) pairs, a frame is only held while moviepy writes its scene."""
+        current = {"scenes": None, "start": 0.0, "end": 0.0, "frame": None}
+
+        def make_frame(t):
+            # moviepy asks for the frames in order, start over if it ever goes back
+            if current["scenes"] is None or t < current["start"]:
+                current.update(scenes=scenes(), start=0.0, end=0.0, frame=None)
+            while current["frame"] is None or t >= current["end"]:
+                try:
+                    frame, scene_duration = next(current["scenes"])
+                except StopIteration:
+                    break  # Rounding past the end of the last scene keeps showing it
+                current.update(start=current["end"], end=current["end"] + scene_duration, frame=frame)
+            return current["frame"]
+
+        video_clip = VideoClip(make_frame, duration=duration)
+        
+        # Add audio and ensure perfect synchronization
+        if audio_path:
+            # The scene durations are planned from the audio, so the two already have the same length
+            audio_clip = AudioFileClip(audio_path)
+            
+            # Combine video and audio
+            final_video = video_clip.set_audio(audio_clip)
+        else:
+            final_video = video_clip
+        
+        # Write the final video with proper cleanup
+        final_video.write_videofile(
+            output_path,
+            fps=fps,
+            codec='libx264',
+            preset=preset,
+            audio_codec='aac',
+            verbose=False,
+            logger=None
+        )
+        
+        # Clean up clips to free memory
+        final_video.close()
+        video_clip.close()
+
+    def generate(self, name: str, audio_path: str, image_paths: list, renditions: list = None, durations: list = None, progress=None,
+                 wait_for_image=None, quality: str = "final"):
+        """
+        Render the slideshow in every rendition of VIDEO_RENDITIONS listed in renditions, from a single decode
+        of the images. The first rendition is written to {name}.mp4 and becomes self.path, the others to
+        {name}_{rendition}.mp4. Returns self.path, self.renditions maps every rendition to its file.
+        durations gives the seconds of every image, see utils.SceneTiming. Without it the audio is split evenly.
+        progress is called with the frames encoded and the frames to encode, by the ffmpeg encoder only.
+        wait_for_image(index), see utils.ImageArrivals, lets the video be assembled while the images are generated:
+        every scene is encoded, in narration order, as soon as its image has arrived.
+        quality "preview" renders only {name}_preview.mp4 with the VIDEO_QUALITIES preview settings, returns it and
+        keeps it in self.preview_path, leaving the final video and self.path as they are.
+        """
         # Ensure the output videos directory exists
         video_dir = './output/videos'
         if not os.path.exists(video_dir):
             os.makedirs(video_dir, exist_ok=True)
 
-        video_name = f'{name}.mp4'
-        self.file_path = os.path.join('./output/videos', video_name)
+        renditions = renditions or self.default_renditions
+        unknown = [rendition for rendition in renditions if rendition not in VIDEO_RENDITIONS]
+        if unknown:
+            raise VideoGenerationException(
+                f"Unknown video renditions: {', '.join(unknown)}",
+                details={"known_renditions": list(VIDEO_RENDITIONS.keys())}
+            )
+
+        if quality not in VIDEO_QUALITIES:
+            raise VideoGenerationException(
+                f"Unknown video quality: {quality}",
+                details={"known_qualities": list(VIDEO_QUALITIES.keys())}
+            )
+        settings = VIDEO_QUALITIES[quality]
+
+        if quality == "preview":
+            # Only the first rendition, scaled down, and the final video is left as it is
+            self.preview_path = os.path.join(video_dir, f'{name}_preview.mp4')
+            outputs = [(self.preview_path, Video._preview_size(VIDEO_RENDITIONS[renditions[0]]["size"], settings["max_side"]))]
+        else:
+            self.renditions = {}
+            for index, rendition in enumerate(renditions):
+                video_name = f'{name}.mp4' if index == 0 else f'{name}_{rendition}.mp4'
+                self.renditions[rendition] = os.path.join(video_dir, video_name)
+            self.path = self.renditions[renditions[0]]
+            outputs = [(self.renditions[rendition], VIDEO_RENDITIONS[rendition]["size"]) for rendition in renditions]
 
         try:
             # Validate input
@@ -28,133 +218,116 @@ class Video:
                     details={"image_count": 0}
                 )
             
-            # Check if image files actually exist
-            existing_images = [img_path for img_path in image_paths if os.path.exists(img_path)]
-            if not existing_images:
-                raise VideoGenerationException(
-                    "None of the provided image files exist",
-                    details={"provided_paths": image_paths}
-                )
-            
-            # Prepare images for video creation
-            temp_dir = tempfile.mkdtemp()
-            processed_images = []
-            
-            for i, img_path in enumerate(existing_images):
-                try:
-                    # Open and resize each image
-                    img = PILImage.open(img_path)
-                    img = img.resize((800, 600)).convert('RGB')  # Ensure consistent size and format
-                    
-                    # Save processed image to temp directory
-                    temp_img_path = os.path.join(temp_dir, f"img_{i:03d}.jpg")
-                    img.save(temp_img_path)
-                    processed_images.append(temp_img_path)
-                except Exception as e:
-                    print(f"Warning: Failed to process image {img_path}: {e}")
-                    continue
-            
-            if not processed_images:
-                raise VideoGenerationException(
-                    "Failed to process any images for video generation",
-                    details={"attempted_images": len(existing_images)}
-                )
+            if wait_for_image:
+                # Images still being generated are waited for when the encoder gets to their scenes
+                existing_images = list(image_paths)
+                images = lambda: Video._arriving(existing_images, wait_for_image)
+            else:
+                # Check if image files actually exist
+                existing_images = [img_path for img_path in image_paths if os.path.exists(img_path)]
+                if not existing_images:
+                    raise VideoGenerationException(
+                        "None of the provided image files exist",
+                        details={"provided_paths": image_paths}
+                    )
+                images = lambda: existing_images
             
             # Create video from images with better audio synchronization
-            fps = 24
+            fps = settings["fps"]
             
-            # First, get audio duration to plan video timing
+            # First, get audio duration to plan video timing, read from the file headers rather than by opening the audio
             audio_duration = None
-            if os.path.exists(audio_path):
-                temp_audio_clip = AudioFileClip(audio_path)
-                audio_duration = temp_audio_clip.duration
-                temp_audio_clip.close()  # Close to free memory
+            if audio_path and os.path.exists(audio_path):
+                audio_duration = MediaProbe.duration(audio_path)
+            else:
+                audio_path = None
             
-            if audio_duration and len(processed_images) > 0:
+            if durations and len(durations) == len(image_paths):
+                # Scene durations planned from the narration, for the images that exist. Images that have not arrived
+                # yet are folded by _scenes() instead, should they fail.
+                if not wait_for_image:
+                    durations = Video._fold_durations([os.path.exists(img_path) for img_path in image_paths], durations)
+                print(f"Audio duration: {audio_duration or 0:.1f}s, scene durations: {', '.join(f'{duration:.1f}s' for duration in durations)}")
+            elif audio_duration:
                 # Calculate duration per image to match audio length
-                num_images = len(processed_images)
+                num_images = len(existing_images)
                 duration_per_image = audio_duration / num_images
                 # Ensure minimum duration per image (at least 1 second)
                 duration_per_image = max(duration_per_image, 1.0)
                 
                 print(f"Audio duration: {audio_duration:.1f}s, Images: {num_images}, Duration per image: {duration_per_image:.1f}s")
-                
-                # Create individual image clips with specific durations
-                from moviepy.editor import ImageClip, concatenate_videoclips
-                image_clips = []
-                
-                for img_path in processed_images:
-                    clip = ImageClip(img_path).set_duration(duration_per_image).set_fps(fps)
-                    image_clips.append(clip)
-                
-                # Concatenate all image clips
-                video_clip = concatenate_videoclips(image_clips, method="compose")
-                
+                durations = [duration_per_image] * len(existing_images)
             else:
-                # No audio or no images, use default timing
-                duration_per_image = 3.0  # seconds per image
-                from moviepy.editor import ImageClip, concatenate_videoclips
-                image_clips = []
-                
-                for img_path in processed_images:
-                    clip = ImageClip(img_path).set_duration(duration_per_image).set_fps(fps)
-                    image_clips.append(clip)
-                
-                video_clip = concatenate_videoclips(image_clips, method="compose")
-            
-            # Add audio and ensure perfect synchronization
-            if path.exists(audio_path):
-                # Create a fresh audio clip for final composition
-                audio_clip = AudioFileClip(audio_path)
-                
-                print(f"Video duration: {video_clip.duration:.1f}s, Audio duration: {audio_clip.duration:.1f}s")
-                
-                # Ensure video and audio have exactly the same duration
-                if abs(video_clip.duration - audio_clip.duration) > 0.1:  # If difference > 0.1 seconds
-                    if video_clip.duration > audio_clip.duration:
-                        # Trim video to match audio
-                        video_clip = video_clip.subclip(0, audio_clip.duration)
-                        print(f"Trimmed video to {audio_clip.duration:.1f}s")
-                    else:
-                        # Trim audio to match video duration
-                        audio_clip = audio_clip.subclip(0, video_clip.duration)
-                        print(f"Trimmed audio to {video_clip.duration:.1f}s")
-                
-                # Combine video and audio
-                final_video = video_clip.set_audio(audio_clip)
+                # No audio, use default timing
+                durations = [3.0] * len(existing_images)  # seconds per image
+
+            if self.encoder == "ffmpeg":
+                # Decode every image once into frames of a shared master size, ffmpeg scales them to each rendition.
+                # The frames are decoded as the encoder gets to their scenes and released once encoded.
+                master_size = Video._master_size(images(), [size for _, size in outputs])
+                # Arriving images are prepared in this process as they come in, a pool could not work ahead of them
+                scenes = Video._scenes(images(), durations, master_size, self.fit, max_workers=1 if wait_for_image else None)
+                effects = scene_effects(self.motion, len(existing_images))
+                encoder = SlideshowEncoder(
+                    size=master_size, fps=fps, preset=settings["preset"], crf=settings["crf"], fit=self.fit,
+                    transition=self.transition, transition_duration=self.transition_duration,
+                    cache=SegmentCache(settings["cache_dir"], share=settings["cache_share"])
+                )
+                encoder.encode(
+                    scenes, audio_path, outputs, effects=effects, progress=progress, duration=sum(durations)
+                )
             else:
-                final_video = video_clip
-            
-            # Write the final video with proper cleanup
-            final_video.write_videofile(
-                self.path,
-                fps=fps,
-                codec='libx264',
-                audio_codec='aac',
-                verbose=False,
-                logger=None
-            )
-            
-            # Clean up clips to free memory
-            final_video.close()
-            video_clip.close()
-            
-            # Clean up temporary files
-            for temp_file in processed_images:
-                if path.exists(temp_file):
-                    os.remove(temp_file)
-            os.rmdir(temp_dir)
+                for output_path, (width, height) in outputs:
+                    scenes = lambda: ((np.frombuffer(frame, dtype=np.uint8).reshape(height, width, 3), duration)
+                                      for frame, duration in Video._scenes(images(), durations, (width, height), self.fit))
+                    self._render_moviepy(scenes, sum(durations), audio_path, fps, output_path, preset=settings["preset"])
+
+            # Stays flat however many scenes the story has, as only the scenes being encoded are in memory
+            own_mb, child_mb = peak_memory_mb()
+            if own_mb is not None:
+                print(f"Peak memory: {own_mb:.0f} MB, largest child process {child_mb:.0f} MB")
             
         except Exception as e:
             raise VideoGenerationException(
                 f"Video generation failed: {str(e)}",
-                method="moviepy",
+                method=self.encoder,
                 details={
                     "error": str(e), 
                     "audio_path": audio_path, 
                     "image_count": len(image_paths),
-                    "output_path": self.path
+                    "renditions": renditions,
+                    "quality": quality
                 }
             )
 
-        return self.path
\ No newline at end of file
+        return outputs[0][0]
+
+    def add_subtitles(self, timings: list, english_text: str) -> dict:
+        """
+        Write Hindi and English captions from the narration timing map as SRT and WebVTT next to the video, and mux
+        them into every rendition as soft tracks by stream copy. Returns {language: srt path}.
+        """
+        if not self.subtitles_enabled or not self.renditions or not timings:
+            return {}
+
+        base = os.path.splitext(self.path)[0]
+        cues = {"hi": Subtitles.hindi_cues(timings), "en": Subtitles.english_cues(english_text, timings)}
+
+        subtitles = {}
+        for language, language_cues in cues.items():
+            if language_cues:
+                subtitles[language] = Subtitles.write_srt(language_cues, f"{base}.{language}.srt")
+                Subtitles.write_vtt(language_cues, f"{base}.{language}.vtt")
+
+        try:
+            for video_path in self.renditions.values():
+                Subtitles.mux_subtitles(video_path, subtitles)
+        except subprocess.CalledProcessError as e:
+            raise VideoGenerationException(
+                "Failed to add subtitles to the video",
+                method="ffmpeg",
+                details={"error": e.stderr, "renditions": self.renditions}
+            )
+
+        self.subtitles = subtitles
+        return subtitles
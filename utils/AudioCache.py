@@ -0,0 +1,103 @@
+import hashlib, json, os, re, shutil, time, unicodedata
+from os import getenv, makedirs, path
+from threading import Lock
+
+from utils.Utils import read_json, write_json
+
+class AudioCache:
+    """
+    Content addressed cache of synthesized audio.
+
+    Entries are keyed by a hash of the normalized text and every TTS setting that
+    changes the output (engine, language, voice and rate), so editing the text never
+    returns stale audio and the same text is never synthesized twice, whatever the
+    story title. Each entry holds the encoded file and its duration, and is hard
+    linked into the output directory. Least recently used entries are evicted once
+    the cache grows beyond max_bytes.
+    """
+    def __init__(self, cache_dir: str = "./output/audios/cache", max_bytes: int = None):
+        self.cache_dir = path.abspath(cache_dir)
+        self.index_path = path.join(self.cache_dir, "index.json")
+        self.max_bytes = max_bytes or int(getenv('AUDIO_CACHE_MAX_BYTES', 500 * 1024 * 1024))
+        self._lock = Lock()
+
+        makedirs(self.cache_dir, exist_ok=True)
+
+    @staticmethod
+    def key(text: str, engine: str, language: str, voice: str = None, rate=None) -> str:
+        normalized = re.sub(r"\s+", " ", unicodedata.normalize("NFC", text)).strip()
+        material = json.dumps([normalized, engine.lower(), language, voice, rate], ensure_ascii=False)
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def _load(self) -> dict:
+        return read_json(self.index_path, {}, "audio cache index")
+
+    def _save(self, index: dict) -> None:
+        write_json(self.index_path, index)
+
+    def get(self, key: str) -> dict:
+        """Return the cache entry for key, or None if it is not cached."""
+        with self._lock:
+            index = self._load()
+            entry = index.get(key)
+            if not entry:
+                return None
+
+            if not path.exists(entry["path"]):
+                del index[key]
+                self._save(index)
+                return None
+
+            entry["last_used"] = time.time()
+            self._save(index)
+            return entry
+
+    def put(self, key: str, source_path: str, duration: float, **metadata) -> dict:
+        """Store a copy of source_path under key, extra metadata is kept in the entry as is."""
+        extension = path.splitext(source_path)[1]
+        cached_path = path.join(self.cache_dir, key + extension)
+        shutil.copyfile(source_path, cached_path)
+
+        entry = {
+            "path": cached_path,
+            "duration": duration,
+            "size": path.getsize(cached_path),
+            "last_used": time.time(),
+            **metadata
+        }
+
+        with self._lock:
+            index = self._load()
+            index[key] = entry
+            self._evict(index, keep=key)
+            self._save(index)
+
+        return entry
+
+    def link(self, entry: dict, destination: str) -> str:
+        """Make the cached file available at destination, by hard link where the filesystem allows it."""
+        if path.exists(destination):
+            os.remove(destination)
+
+        try:
+            os.link(entry["path"], destination)
+        except OSError:
+            shutil.copyfile(entry["path"], destination)
+
+        return destination
+
+    def _evict(self, index: dict, keep: str) -> None:
+        total = sum(entry.get("size", 0) for entry in index.values())
+
+        for key in sorted(index, key=lambda k: index[k].get("last_used", 0)):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+
+            entry = index.pop(key)
+            total -= entry.get("size", 0)
+            try:
+                os.remove(entry["path"])
+            except OSError:
+                pass
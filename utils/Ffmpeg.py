@@ -0,0 +1,54 @@
+import shutil, subprocess, tempfile
+
+'''
+Note: Helpers to drive the ffmpeg command line directly.
+ffmpeg on the PATH is preferred, otherwise the binary bundled with imageio-ffmpeg (a moviepy dependency) is used.
+'''
+
+def ffmpeg_exe() -> str:
+    exe = shutil.which("ffmpeg")
+    if exe:
+        return exe
+
+    import imageio_ffmpeg
+    return imageio_ffmpeg.get_ffmpeg_exe()
+
+def run_ffmpeg(args: list, input: bytes = None) -> bytes:
+    """Run ffmpeg with args and return its stdout, raises subprocess.CalledProcessError with ffmpeg's stderr on failure."""
+    command = [ffmpeg_exe(), "-hide_banner", "-loglevel", "error", "-y"]
+    if input is None:
+        command.append("-nostdin")
+    command += list(args)
+
+    result = subprocess.run(command, input=input, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        raise subprocess.CalledProcessError(result.returncode, command, output=result.stdout, stderr=result.stderr.decode(errors="replace"))
+
+    return result.stdout
+
+def pipe_ffmpeg(args: list, chunks) -> None:
+    """
+    Run ffmpeg with args, writing every chunk of bytes from the iterable chunks to its stdin as it is produced,
+    so that the input never has to be held in memory at once. Raises subprocess.CalledProcessError like run_ffmpeg.
+    """
+    command = [ffmpeg_exe(), "-hide_banner", "-loglevel", "error", "-y"] + list(args)
+
+    # stderr goes to a file, a pipe that is not read could fill up and block ffmpeg while it is being fed
+    with tempfile.TemporaryFile() as stderr:
+        process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=stderr)
+        try:
+            for chunk in chunks:
+                process.stdin.write(chunk)
+        except BrokenPipeError:
+            pass  # ffmpeg stopped reading, the reason is in its stderr
+        finally:
+            # Also reached when producing a chunk fails, ffmpeg then sees the end of its input instead of waiting forever
+            try:
+                process.stdin.close()
+            except BrokenPipeError:
+                pass
+            returncode = process.wait()
+
+        if returncode != 0:
+            stderr.seek(0)
+            raise subprocess.CalledProcessError(returncode, command, stderr=stderr.read().decode(errors="replace"))
@@ -0,0 +1,85 @@
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from os import cpu_count, getenv
+from PIL import Image as PILImage, ImageOps
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+'''
+Note: Prepares video frames from the scene images in memory.
+Every image is decoded and resampled once, in a pool of processes, into a raw RGB24 buffer that can be
+piped to ffmpeg or wrapped in a NumPy array, so no intermediate image files are written.
+Frames are streamed in scene order and only a few are prepared ahead of the consumer, so memory stays the same
+however many scenes a story has.
+'''
+
+FIT_MODES = ("letterbox", "crop")
+
+def prepare_frame(image_path: str, size: tuple, fit: str = "letterbox") -> bytes:
+    """
+    Decode image_path and resample it to size, returns the frame as raw RGB24 bytes.
+
+    "letterbox" keeps the whole image and pads it with black bars, "crop" fills the frame
+    and cuts what does not fit. Both keep the aspect ratio of the image.
+    Kept at module level so that it can be pickled to the worker processes.
+    """
+    with PILImage.open(image_path) as img:
+        img = img.convert('RGB')
+        if img.size != tuple(size):
+            if fit == "crop":
+                img = ImageOps.fit(img, size, method=PILImage.LANCZOS)
+            else:
+                img = ImageOps.pad(img, size, method=PILImage.LANCZOS, color=(0, 0, 0))
+        return img.tobytes()
+
+def _prepare_or_none(image_path: str, size: tuple, fit: str) -> bytes:
+    if image_path is None:
+        return None  # No image for this scene, already reported where it failed
+
+    try:
+        return prepare_frame(image_path, size, fit)
+    except Exception as e:
+        print(f"Warning: Failed to process image {image_path}: {e}")
+        return None
+
+def stream_frames(image_paths: list, size: tuple, fit: str = "letterbox", max_workers: int = None):
+    """
+    Yield a frame for every image, in the order of image_paths, preparing at most one per worker ahead of
+    the consumer. Images that cannot be read are reported and come back as None.
+    """
+    if fit not in FIT_MODES:
+        raise ValueError(f"Unknown fit mode {fit}, expected one of {FIT_MODES}")
+
+    max_workers = max_workers or int(getenv('VIDEO_PREP_WORKERS', cpu_count() or 1))
+    # image_paths may also be an iterator over images that are still arriving
+    if hasattr(image_paths, "__len__"):
+        max_workers = min(max_workers, len(image_paths))
+
+    # Starting worker processes costs more than resampling a single image
+    if max_workers <= 1:
+        for image_path in image_paths:
+            yield _prepare_or_none(image_path, size, fit)
+        return
+
+    # Called from threaded processes such as Streamlit, where a forked worker may inherit a held lock
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=get_context("spawn")) as pool:
+        pending = deque()
+        for image_path in image_paths:
+            pending.append(pool.submit(_prepare_or_none, image_path, size, fit))
+            if len(pending) >= max_workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+def peak_memory_mb() -> tuple:
+    """Peak resident memory in MB of this process and of its largest finished child process, e.g. ffmpeg."""
+    if resource is None:
+        return None, None
+
+    # ru_maxrss is in kilobytes on Linux
+    return (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024)
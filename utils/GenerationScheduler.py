@@ -0,0 +1,92 @@
+import requests
+from collections import deque
+from statistics import median
+from threading import Lock
+
+# Generation profiles in order of decreasing quality (and cost)
+GENERATION_PROFILES = [
+    {"name": "hq", "steps": 30, "width": 512, "height": 512, "slow_workers": True, "models": ["stable_diffusion"]},
+    {"name": "standard", "steps": 25, "width": 512, "height": 512, "slow_workers": False, "models": ["stable_diffusion"]},
+    {"name": "fast", "steps": 20, "width": 448, "height": 448, "slow_workers": False, "models": ["stable_diffusion"]},
+    {"name": "draft", "steps": 12, "width": 384, "height": 384, "slow_workers": False, "models": ["stable_diffusion"]}
+]
+
+# Latency target in seconds and the profiles each mode may choose from
+GENERATION_MODES = {
+    "draft": {"latency_target": 90, "profiles": ["fast", "draft"]},
+    "final": {"latency_target": 600, "profiles": ["hq", "standard", "fast"]}
+}
+
+class GenerationScheduler:
+    """
+    Picks AI Horde generation parameters from the current queue load.
+
+    The scheduler keeps the wait_time and queue_position reported by recent
+    /generate/check polls, and falls back to the horde performance endpoint when
+    it has not seen any. The estimated turnaround of every profile allowed for the
+    mode is compared with the mode's latency target, and the best profile that
+    fits is used. When none fits the cheapest one is used.
+    """
+    PERFORMANCE_URL = "https://stablehorde.net/api/v2/status/performance"
+    SECONDS_PER_MEGAPIXELSTEP = 0.5  # Rough throughput of a single worker
+    SLOW_WORKERS_PENALTY = 1.5  # Slow workers take longer once they pick up a job
+
+    def __init__(self, mode: str = "final", latency_target: int = None):
+        if mode not in GENERATION_MODES:
+            raise ValueError(f"Unknown generation mode: {mode}, valid modes: {list(GENERATION_MODES)}")
+
+        self.mode = mode
+        self.latency_target = latency_target or GENERATION_MODES[mode]["latency_target"]
+        self.observations = deque(maxlen=10)
+        self._lock = Lock()
+
+    @staticmethod
+    def megapixelsteps(profile: dict) -> float:
+        return profile["width"] * profile["height"] * profile["steps"] / 1_000_000
+
+    def observe(self, check_result: dict) -> None:
+        """Record the queue state reported by a /generate/check poll."""
+        if "wait_time" not in check_result:
+            return
+
+        with self._lock:
+            self.observations.append((check_result.get("wait_time", 0), check_result.get("queue_position", 0)))
+
+    def sample_queue(self) -> float:
+        """Estimated queue wait in seconds before a new job is picked up by a worker."""
+        with self._lock:
+            if self.observations:
+                return median(wait_time for wait_time, _ in self.observations)
+
+        try:
+            response = requests.get(GenerationScheduler.PERFORMANCE_URL, timeout=10)
+            response.raise_for_status()
+            performance = response.json()
+
+            # Time to drain the queue at the throughput of the past minute
+            queued = performance.get("queued_megapixelsteps", 0)
+            throughput = performance.get("past_minute_megapixelsteps", 0) / 60
+            return queued / throughput if throughput else 0
+        except (requests.exceptions.RequestException, ValueError) as e:
+            print(f"Warning: Failed to sample AI Horde queue, assuming an empty queue: {e}")
+            return 0
+
+    def estimate_latency(self, profile: dict, queue_wait: float) -> float:
+        generation_time = GenerationScheduler.megapixelsteps(profile) * GenerationScheduler.SECONDS_PER_MEGAPIXELSTEP
+        if profile["slow_workers"]:
+            return (queue_wait + generation_time) * GenerationScheduler.SLOW_WORKERS_PENALTY
+
+        return queue_wait + generation_time
+
+    def pick_profile(self) -> dict:
+        queue_wait = self.sample_queue()
+        candidates = [profile for profile in GENERATION_PROFILES if profile["name"] in GENERATION_MODES[self.mode]["profiles"]]
+
+        for profile in candidates:
+            if self.estimate_latency(profile, queue_wait) <= self.latency_target:
+                break
+        else:
+            profile = candidates[-1]
+
+        print(f"Queue wait is about {queue_wait:.0f}s, using '{profile['name']}' profile for {self.mode} images")
+        return dict(profile)
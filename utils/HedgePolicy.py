@@ -0,0 +1,44 @@
+from os import getenv
+from threading import Lock
+
+class HedgePolicy:
+    """
+    Opt-in policy for hedging slow AI Horde jobs.
+
+    When a job reports a wait time above the threshold, or makes no progress for a
+    number of consecutive polls, a duplicate job is submitted. Whichever job finishes
+    first wins and the other one is cancelled. The number of extra submissions is
+    capped per story so that hedging cannot burn through the kudos balance.
+    """
+    def __init__(self, wait_threshold: int = 120, stall_polls: int = 4, max_extra_submissions: int = 3):
+        self.wait_threshold = wait_threshold
+        self.stall_polls = stall_polls
+        self.max_extra_submissions = max_extra_submissions
+        self.extra_submissions = 0
+        self._lock = Lock()
+
+    @classmethod
+    def from_env(cls):
+        """Build a policy from the environment, returns None unless AIHORDE_HEDGE is enabled."""
+        if getenv('AIHORDE_HEDGE', 'false').lower() != 'true':
+            return None
+
+        return cls(
+            wait_threshold=int(getenv('AIHORDE_HEDGE_WAIT_THRESHOLD', 120)),
+            stall_polls=int(getenv('AIHORDE_HEDGE_STALL_POLLS', 4)),
+            max_extra_submissions=int(getenv('AIHORDE_HEDGE_MAX_EXTRA', 3))
+        )
+
+    def should_hedge(self, check_result: dict, stalled_polls: int) -> bool:
+        if check_result.get("wait_time", 0) > self.wait_threshold:
+            return True
+
+        return stalled_polls >= self.stall_polls
+
+    def try_acquire(self) -> bool:
+        """Reserve one extra submission, returns False once the cost cap has been reached."""
+        with self._lock:
+            if self.extra_submissions >= self.max_extra_submissions:
+                return False
+            self.extra_submissions += 1
+            return True
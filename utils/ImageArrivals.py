@@ -0,0 +1,36 @@
+from threading import Condition
+
+class ImageArrivals:
+    """
+    Tracks the scenery images of a story as they are generated, so that the video
+    can be assembled from the images that are in while the others are on the way.
+
+    The image generator calls arrived() for every image it is done with, and
+    finish() once it stops, after which images it never got to count as failed.
+    The video encoder calls wait() for the image of each scene in turn, and close()
+    if it gives up, which tells the image generator to stop at the next image.
+    """
+    def __init__(self, count: int):
+        self.ready = [None] * count  # True once the image is written, False if it will not be
+        self.closed = False
+        self.condition = Condition()
+
+    def arrived(self, index: int, ok: bool = True) -> None:
+        with self.condition:
+            self.ready[index] = ok
+            self.condition.notify_all()
+
+    def finish(self) -> None:
+        with self.condition:
+            self.ready = [False if ok is None else ok for ok in self.ready]
+            self.condition.notify_all()
+
+    def close(self) -> None:
+        self.closed = True
+        self.finish()
+
+    def wait(self, index: int) -> bool:
+        """Block until the image at index is written or given up on, returns whether it can be used."""
+        with self.condition:
+            self.condition.wait_for(lambda: self.ready[index] is not None)
+            return self.ready[index]
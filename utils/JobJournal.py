@@ -0,0 +1,96 @@
+import hashlib, time
+from os import getenv
+from threading import Lock
+
+from utils.Utils import read_json, write_json
+
+class JobJournal:
+    """
+    Small on-disk journal of submitted AI Horde jobs.
+
+    Every job is written to the journal as soon as AI Horde hands back its id, so
+    a restarted Streamlit session or CLI run can resume polling the job instead of
+    submitting the same prompt again and wasting kudos and queue time.
+
+    AI Horde forgets jobs long before the journal would grow large, so entries
+    older than max_age seconds are dropped whenever the journal is loaded.
+    """
+    PENDING = "pending"
+    DONE = "done"
+    DOWNLOADED = "downloaded"
+    FAULTED = "faulted"
+    EXPIRED = "expired"
+    CANCELLED = "cancelled"
+
+    UNFINISHED = (PENDING, DONE)
+
+    def __init__(self, journal_path: str = "./output/images/aihorde_jobs.json", max_age: float = None):
+        self.journal_path = journal_path
+        self.max_age = max_age or float(getenv('AIHORDE_JOURNAL_MAX_AGE', 24 * 60 * 60))
+        self._lock = Lock()
+
+    @staticmethod
+    def prompt_hash(prompt: str) -> str:
+        return hashlib.sha256(prompt.strip().encode("utf-8")).hexdigest()[:16]
+
+    @staticmethod
+    def title(scenery_title: str, mode: str) -> str:
+        """Journal title of the jobs of a scenery, draft and final jobs must not be resumed in place of each other."""
+        return scenery_title if mode == "final" else f"{scenery_title}:{mode}"
+
+    def _load(self) -> list:
+        entries = read_json(self.journal_path, [], "job journal")
+
+        # Jobs this old are gone from AI Horde and can neither be resumed nor downloaded
+        cutoff = time.time() - self.max_age
+        current = [entry for entry in entries if entry.get("submitted_at", 0) >= cutoff]
+        if len(current) < len(entries):
+            print(f"Pruning {len(entries) - len(current)} job(s) older than {self.max_age:.0f} seconds from {self.journal_path}")
+            self._save(current)
+        return current
+
+    def _save(self, entries: list) -> None:
+        write_json(self.journal_path, entries)
+
+    def record(self, title: str, prompt: str, job_id: str, status: str = PENDING) -> dict:
+        entry = {
+            "title": title,
+            "prompt_hash": self.prompt_hash(prompt),
+            "job_id": job_id,
+            "submitted_at": time.time(),
+            "status": status
+        }
+
+        with self._lock:
+            entries = self._load()
+            entries.append(entry)
+            self._save(entries)
+
+        return entry
+
+    def update(self, job_id: str, status: str) -> None:
+        with self._lock:
+            entries = self._load()
+            for entry in entries:
+                if entry.get("job_id") == job_id:
+                    entry["status"] = status
+                    entry["updated_at"] = time.time()
+            self._save(entries)
+
+    def find_unfinished(self, title: str, prompt: str) -> dict:
+        """Return the most recent unfinished job for the given scenery title and prompt, if any."""
+        prompt_hash = self.prompt_hash(prompt)
+
+        for entry in reversed(self.unfinished()):
+            if entry.get("title") == title and entry.get("prompt_hash") == prompt_hash:
+                return entry
+
+        return None
+
+    def unfinished(self, titles: set = None) -> list:
+        """Unfinished jobs, only those of the given journal titles if titles is given."""
+        with self._lock:
+            return [
+                entry for entry in self._load()
+                if entry.get("status") in JobJournal.UNFINISHED and (titles is None or entry.get("title") in titles)
+            ]
@@ -0,0 +1,111 @@
+import hashlib, json, shutil, subprocess
+from os import path
+from threading import Lock
+
+from mutagen import File as MutagenFile
+
+from utils.Utils import read_json, write_json
+
+'''
+Note: Reads media duration and stream information from container headers, without decoding.
+mutagen is tried first as it needs no external process, ffprobe is used for what mutagen cannot read
+(e.g. video streams). Results are cached per file content hash, in memory and on disk.
+'''
+
+CACHE_PATH = "./output/media_probe_cache.json"
+SAMPLE_BYTES = 1024 * 1024  # Bytes hashed from the start and the end of a file
+
+_cache = None
+_cache_lock = Lock()
+
+def _file_hash(file_path: str) -> str:
+    """Hash of the size, first and last megabyte of a file, enough to tell rendered media files apart quickly."""
+    size = path.getsize(file_path)
+    digest = hashlib.sha1(str(size).encode())
+
+    with open(file_path, "rb") as f:
+        digest.update(f.read(SAMPLE_BYTES))
+        if size > SAMPLE_BYTES:
+            f.seek(max(SAMPLE_BYTES, size - SAMPLE_BYTES))
+            digest.update(f.read(SAMPLE_BYTES))
+
+    return digest.hexdigest()
+
+def _load_cache() -> dict:
+    global _cache
+    if _cache is None:
+        _cache = read_json(CACHE_PATH, {}, "media probe cache")
+    return _cache
+
+def _save_cache() -> None:
+    write_json(CACHE_PATH, _cache)
+
+def _probe_mutagen(file_path: str) -> dict:
+    media = MutagenFile(file_path)
+    if media is None or not getattr(media, "info", None):
+        return None
+
+    info = media.info
+    stream = {"type": "audio"}
+    for attribute in ("sample_rate", "channels", "bitrate", "codec"):
+        if getattr(info, attribute, None) is not None:
+            stream[attribute] = getattr(info, attribute)
+
+    return {"duration": info.length, "streams": [stream], "source": "mutagen"}
+
+def _probe_ffprobe(file_path: str) -> dict:
+    ffprobe = shutil.which("ffprobe")
+    if not ffprobe:
+        return None
+
+    result = subprocess.run(
+        [ffprobe, "-v", "error", "-show_entries", "format=duration:stream=codec_type,codec_name,width,height,sample_rate,channels,duration", "-of", "json", file_path],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE
+    )
+    if result.returncode != 0:
+        return None
+
+    data = json.loads(result.stdout or b"{}")
+    streams = []
+    for stream in data.get("streams", []):
+        entry = {"type": stream.get("codec_type"), "codec": stream.get("codec_name")}
+        for key in ("width", "height", "channels"):
+            if key in stream:
+                entry[key] = stream[key]
+        if "sample_rate" in stream:
+            entry["sample_rate"] = int(stream["sample_rate"])
+        streams.append(entry)
+
+    duration = data.get("format", {}).get("duration")
+    return {"duration": float(duration) if duration else None, "streams": streams, "source": "ffprobe"}
+
+def probe(file_path: str) -> dict:
+    """Return {"duration": seconds, "streams": [...], "source": ...} for a media file."""
+    key = _file_hash(file_path)
+
+    with _cache_lock:
+        cached = _load_cache().get(key)
+    if cached:
+        return cached
+
+    # Video containers need ffprobe for their video streams, audio is fully described by mutagen
+    is_video = path.splitext(file_path)[1].lower() in (".mp4", ".mov", ".m4v", ".mkv", ".webm")
+    probers = (_probe_ffprobe, _probe_mutagen) if is_video else (_probe_mutagen, _probe_ffprobe)
+
+    result = None
+    for prober in probers:
+        result = prober(file_path)
+        if result and result.get("duration"):
+            break
+
+    if not result or not result.get("duration"):
+        raise ValueError(f"Could not read the duration of {file_path}")
+
+    with _cache_lock:
+        _load_cache()[key] = result
+        _save_cache()
+
+    return result
+
+def duration(file_path: str) -> float:
+    return probe(file_path)["duration"]
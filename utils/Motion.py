@@ -0,0 +1,64 @@
+import numpy as np
+from PIL import Image as PILImage
+
+'''
+Note: Ken Burns style pan and zoom over still images.
+The crop window of every frame of a scene is computed at once as NumPy arrays. Each frame is then cut out of the
+decoded image and resampled in a single call to PIL's C resampler, which takes fractional crop boxes so that slow
+motion does not jitter from pixel to pixel.
+'''
+
+# Crop window at the start and at the end of a scene: (zoom, centre x, centre y), the centre as a fraction of the frame
+MOTION_EFFECTS = {
+    "none": None,
+    "zoom_in": {"start": (1.0, 0.5, 0.5), "end": (1.2, 0.5, 0.5)},
+    "zoom_out": {"start": (1.2, 0.5, 0.5), "end": (1.0, 0.5, 0.5)},
+    "pan_right": {"start": (1.15, 0.4, 0.5), "end": (1.15, 0.6, 0.5)},
+    "pan_left": {"start": (1.15, 0.6, 0.5), "end": (1.15, 0.4, 0.5)},
+}
+
+# Effects taken in turn, scene by scene, when the motion is "auto"
+AUTO_SEQUENCE = ["zoom_in", "pan_right", "zoom_out", "pan_left"]
+
+def scene_effects(motion: str, count: int) -> list:
+    """Effect of each of count scenes for a motion setting, either "auto" or one of MOTION_EFFECTS."""
+    if motion == "auto":
+        return [AUTO_SEQUENCE[index % len(AUTO_SEQUENCE)] for index in range(count)]
+
+    if motion not in MOTION_EFFECTS:
+        raise ValueError(f"Unknown motion {motion}, expected auto or one of {list(MOTION_EFFECTS.keys())}")
+    return [motion] * count
+
+def crop_windows(effect: str, frame_count: int, size: tuple) -> np.ndarray:
+    """(frame_count, 4) array of the left, top, right, bottom crop box of every frame of a scene."""
+    width, height = size
+    settings = MOTION_EFFECTS[effect]
+    if settings is None:
+        return np.tile(np.array([0.0, 0.0, width, height]), (frame_count, 1))
+
+    # Smoothstep easing, the motion starts and ends gently
+    t = np.linspace(0.0, 1.0, frame_count) if frame_count > 1 else np.zeros(1)
+    eased = t * t * (3 - 2 * t)
+
+    start, end = np.array(settings["start"]), np.array(settings["end"])
+    zoom, centre_x, centre_y = (start[:, None] + (end - start)[:, None] * eased).reshape(3, -1)
+
+    crop_width, crop_height = width / zoom, height / zoom
+    left = np.clip(centre_x * width - crop_width / 2, 0, width - crop_width)
+    top = np.clip(centre_y * height - crop_height / 2, 0, height - crop_height)
+    return np.stack([left, top, left + crop_width, top + crop_height], axis=1)
+
+def motion_frames(frame: bytes, size: tuple, effect: str, frame_count: int, start: int = 0, stop: int = None):
+    """
+    Yield raw RGB24 frames of size for a scene of frame_count frames, panning and zooming over frame with effect.
+    start and stop pick a part of the scene, e.g. the frames that are not covered by a transition.
+    """
+    stop = frame_count if stop is None else stop
+    if MOTION_EFFECTS[effect] is None:
+        for _ in range(start, stop):
+            yield frame
+        return
+
+    image = PILImage.frombuffer("RGB", size, frame, "raw", "RGB", 0, 1)
+    for box in crop_windows(effect, frame_count, size)[start:stop]:
+        yield image.resize(size, PILImage.BILINEAR, box=tuple(box)).tobytes()
@@ -0,0 +1,95 @@
+'''
+Note: Minimal MPEG audio frame handling, enough to join MP3 segments without re-encoding them.
+Tags are dropped and the frames of all segments are written back to back, which is how
+players expect a plain MP3 stream to look.
+'''
+
+# Bitrates in kbps indexed by [MPEG1 or not][layer][bitrate index], layer 1 is Layer I
+BITRATES = {
+    True: {
+        1: (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),
+        2: (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),
+        3: (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320)
+    },
+    False: {
+        1: (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+        2: (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+        3: (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160)
+    }
+}
+
+# Sample rates indexed by the version bits of the frame header
+SAMPLE_RATES = {
+    0: (11025, 12000, 8000),  # MPEG 2.5
+    2: (22050, 24000, 16000),  # MPEG 2
+    3: (44100, 48000, 32000)  # MPEG 1
+}
+
+def _parse_header(data: bytes, offset: int) -> dict:
+    """Parse the frame header at offset, returns None if there is no valid frame header there."""
+    if offset + 4 > len(data) or data[offset] != 0xFF or (data[offset + 1] & 0xE0) != 0xE0:
+        return None
+
+    version = (data[offset + 1] >> 3) & 0x03
+    layer = 4 - ((data[offset + 1] >> 1) & 0x03)
+    bitrate_index = data[offset + 2] >> 4
+    sample_rate_index = (data[offset + 2] >> 2) & 0x03
+    padding = (data[offset + 2] >> 1) & 0x01
+    mono = (data[offset + 3] >> 6) == 3
+
+    if version == 1 or layer == 4 or bitrate_index in (0, 15) or sample_rate_index == 3:
+        return None
+
+    mpeg1 = version == 3
+    bitrate = BITRATES[mpeg1][layer][bitrate_index] * 1000
+    sample_rate = SAMPLE_RATES[version][sample_rate_index]
+
+    if layer == 1:
+        samples = 384
+        length = (12 * bitrate // sample_rate + padding) * 4
+    else:
+        samples = 1152 if mpeg1 or layer == 2 else 576
+        length = (samples // 8) * bitrate // sample_rate + padding
+
+    # Offset of a Xing/Info tag, which sits right after the side information of the first frame
+    side_info = (17 if mono else 32) if mpeg1 else (9 if mono else 17)
+
+    return {"length": length, "samples": samples, "sample_rate": sample_rate, "tag_offset": 4 + side_info}
+
+def _strip_tags(data: bytes) -> bytes:
+    # ID3v2 at the start, its size is a syncsafe integer and excludes the 10 byte header
+    while data[:3] == b"ID3" and len(data) >= 10:
+        size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+        footer = 10 if data[5] & 0x10 else 0
+        data = data[10 + size + footer:]
+
+    # ID3v1 at the end
+    if len(data) >= 128 and data[-128:-125] == b"TAG":
+        data = data[:-128]
+
+    return data
+
+def frames(data: bytes):
+    """Yield (header, frame bytes) for every audio frame, skipping tags and Xing/Info/VBRI frames."""
+    data = _strip_tags(data)
+    offset = 0
+
+    while offset < len(data):
+        header = _parse_header(data, offset)
+        if not header or header["length"] <= 0:
+            # Not at a frame boundary, resynchronise on the next byte
+            offset += 1
+            continue
+
+        frame = data[offset:offset + header["length"]]
+        offset += header["length"]
+
+        tag = frame[header["tag_offset"]:header["tag_offset"] + 4]
+        if tag in (b"Xing", b"Info") or frame[36:40] == b"VBRI":
+            continue
+
+        yield header, frame
+
+def concat(segments: list) -> bytes:
+    """Join MP3 segments at frame level without decoding or re-encoding them."""
+    return b"".join(frame for segment in segments for _, frame in frames(segment))
@@ -0,0 +1,176 @@
+import atexit, itertools, multiprocessing, time
+from os import path
+from queue import Empty
+from threading import Lock
+
+from exceptions import AudioGenerationException
+
+# How often a wait for the worker checks that its process is still alive, in seconds
+POLL_INTERVAL = 1.0
+
+def _wait_until_flushed(file_path: str, timeout: float) -> None:
+    """Return once the file exists and its size has stopped changing, the driver may write it asynchronously."""
+    deadline = time.monotonic() + timeout
+    last_size = -1
+
+    while time.monotonic() < deadline:
+        size = path.getsize(file_path) if path.exists(file_path) else -1
+        if size > 0 and size == last_size:
+            return
+        last_size = size
+        time.sleep(0.05)
+
+    raise TimeoutError(f"{file_path} was not written within {timeout} seconds")
+
+def _worker_main(jobs, results, rate: int, volume: float, language: str) -> None:
+    """Entry point of the worker process, initializes the engine once and then serves jobs until told to stop."""
+    import pyttsx3
+
+    try:
+        engine = pyttsx3.init()
+        engine.setProperty('rate', rate)  # Speed of speech
+        engine.setProperty('volume', volume)  # Volume level (0.0 to 1.0)
+
+        for voice in engine.getProperty('voices'):
+            if voice.languages and any(language in str(lang).lower() for lang in voice.languages):
+                engine.setProperty('voice', voice.id)
+                break
+    except Exception as e:
+        results.put((None, str(e)))
+        return
+
+    results.put((None, None))  # Engine is ready
+
+    while True:
+        job = jobs.get()
+        if job is None:
+            break
+
+        job_id, text, output_path = job
+        try:
+            engine.save_to_file(text, output_path)
+            engine.runAndWait()
+            _wait_until_flushed(output_path, timeout=30)
+            results.put((job_id, None))
+        except Exception as e:
+            results.put((job_id, str(e)))
+
+    engine.stop()
+
+class Pyttsx3Worker:
+    """
+    Long lived pyttsx3 process shared by all Audio objects.
+
+    Initializing pyttsx3 and scanning its voices for Hindi is slow, so the engine is set up
+    once in a separate process that takes synthesis jobs from a queue and reports back once
+    the output file has been flushed to disk.
+    """
+    _instance = None
+    _instance_lock = Lock()
+
+    def __init__(self, rate: int = 150, volume: float = 0.9, language: str = "hi"):
+        self.rate = rate
+        self.volume = volume
+        self.language = language
+        self.process = None
+        self.jobs = None
+        self.results = None
+        self.job_ids = itertools.count(1)
+        self._lock = Lock()
+
+    @classmethod
+    def get(cls, **kwargs):
+        """Return the shared worker, starting it on first use."""
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls(**kwargs)
+                atexit.register(cls._instance.stop)
+            return cls._instance
+
+    def _start(self) -> None:
+        # spawn keeps the worker free of whatever state the parent (e.g. Streamlit) has set up
+        context = multiprocessing.get_context("spawn")
+        self.jobs = context.Queue()
+        self.results = context.Queue()
+        self.process = context.Process(target=_worker_main, args=(self.jobs, self.results, self.rate, self.volume, self.language), daemon=True)
+        self.process.start()
+
+        result = self._result(timeout=60)
+        if result is None:
+            exitcode = self._kill()
+            raise AudioGenerationException(
+                "pyttsx3 worker did not start" if exitcode is not None else "pyttsx3 worker timed out while starting",
+                library='pyttsx3',
+                language=self.language,
+                details={"timeout": 60, "exitcode": exitcode}
+            )
+
+        _, error = result
+        if error:
+            self.process.join()
+            self.process = None
+            raise AudioGenerationException(
+                f"Failed to initialize pyttsx3: {error}",
+                library='pyttsx3',
+                language=self.language,
+                details={"error": error}
+            )
+
+    def _result(self, timeout: float):
+        """Next result of the worker, or None if its process died or it gave none within timeout."""
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            try:
+                return self.results.get(timeout=min(POLL_INTERVAL, remaining))
+            except Empty:
+                if not self.process.is_alive():
+                    return None
+
+    def _kill(self) -> int:
+        """Stop a worker that died or is stuck, returns its exit code, None if it was still running."""
+        exitcode = self.process.exitcode
+        self.process.terminate()
+        self.process.join(timeout=5)
+        self.process = None
+        return exitcode
+
+    def synthesize(self, text: str, output_path: str, timeout: float = 600) -> str:
+        """Synthesize text to output_path and return once the file is complete."""
+        with self._lock:
+            if self.process is None or not self.process.is_alive():
+                self._start()
+
+            job_id = next(self.job_ids)
+            self.jobs.put((job_id, text, output_path))
+
+            result = self._result(timeout=timeout)
+            if result is None:
+                # The engine crashed or is stuck, a fresh worker is started for the next job
+                exitcode = self._kill()
+                raise AudioGenerationException(
+                    "pyttsx3 worker died" if exitcode is not None else "Audio generation with pyttsx3 timed out",
+                    library='pyttsx3',
+                    language=self.language,
+                    details={"timeout": timeout, "exitcode": exitcode, "text_length": len(text)}
+                )
+
+            result_id, error = result
+
+        if error or result_id != job_id:
+            raise AudioGenerationException(
+                f"Audio generation failed with pyttsx3: {error}",
+                library='pyttsx3',
+                language=self.language,
+                details={"error": error, "text_length": len(text)}
+            )
+
+        return output_path
+
+    def stop(self) -> None:
+        if self.process is not None and self.process.is_alive():
+            self.jobs.put(None)
+            self.process.join(timeout=5)
+        self.process = None
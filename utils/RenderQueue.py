@@ -0,0 +1,164 @@
+import atexit, json, os, sqlite3, time, uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import closing
+from multiprocessing import get_context
+from os import getenv, path
+from threading import Lock
+
+'''
+Note: Background queue for renders that take minutes, so that Streamlit pages never block on them.
+Jobs run in a pool of processes and their state is kept in a SQLite table, which the workers update with their
+progress. A page submits a job, keeps its id and polls it on every rerun, and the table outlives server restarts.
+'''
+
+DB_PATH = "./output/render_jobs.db"
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+def _connect(db_path: str) -> sqlite3.Connection:
+    connection = sqlite3.connect(db_path, timeout=30)
+    connection.row_factory = sqlite3.Row
+    return connection
+
+def _process_alive(pid: int) -> bool:
+    if pid == os.getpid():
+        return True
+
+    if os.name == "nt":
+        # os.kill() terminates the process on Windows, whatever the signal
+        import ctypes
+        handle = ctypes.windll.kernel32.OpenProcess(0x1000, False, pid)  # PROCESS_QUERY_LIMITED_INFORMATION
+        if not handle:
+            return False
+        ctypes.windll.kernel32.CloseHandle(handle)
+        return True
+
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Alive, under another user
+        return True
+    return True
+
+def _update(db_path: str, job_id: str, **fields) -> None:
+    fields["updated"] = time.time()
+    assignments = ", ".join(f"{name} = ?" for name in fields)
+    with closing(_connect(db_path)) as connection, connection:
+        connection.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", list(fields.values()) + [job_id])
+
+class JobProgress:
+    """Progress callback handed to a job function in the worker process, progress(done, total, unit)."""
+    def __init__(self, db_path: str, job_id: str):
+        self.db_path = db_path
+        self.job_id = job_id
+        self.started = time.time()
+
+    def __call__(self, done: int, total: int, unit: str = "frames") -> None:
+        # Estimated from the average rate so far
+        eta = (time.time() - self.started) / done * (total - done) if done else None
+        _update(self.db_path, self.job_id, done=done, total=total, unit=unit, eta=eta)
+
+def _run_job(db_path: str, job_id: str, function, params: dict) -> None:
+    """Runs in a worker process, function(params, progress) returns the JSON serializable result of the job."""
+    _update(db_path, job_id, status=RUNNING)
+    try:
+        result = function(params, JobProgress(db_path, job_id))
+        _update(db_path, job_id, status=DONE, result=json.dumps(result, ensure_ascii=False), eta=0)
+    except Exception as e:
+        print(f"Render job {job_id} failed: {e}")
+        _update(db_path, job_id, status=FAILED, error=str(e))
+
+class RenderQueue:
+    _instance = None
+    _instance_lock = Lock()
+
+    def __init__(self, db_path: str = DB_PATH, max_workers: int = None):
+        self.db_path = db_path
+        os.makedirs(path.dirname(db_path) or ".", exist_ok=True)
+
+        with closing(_connect(self.db_path)) as connection, connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, kind TEXT, story TEXT, status TEXT, done INTEGER, "
+                "total INTEGER, unit TEXT, eta REAL, result TEXT, error TEXT, created REAL, updated REAL, owner INTEGER)"
+            )
+            if "owner" not in [column["name"] for column in connection.execute("PRAGMA table_info(jobs)")]:
+                connection.execute("ALTER TABLE jobs ADD COLUMN owner INTEGER")
+
+            # Jobs of a server process that is gone went with its pool. Other live server processes share the
+            # table, their jobs are left alone.
+            unfinished = connection.execute("SELECT id, owner FROM jobs WHERE status IN (?, ?)", (QUEUED, RUNNING)).fetchall()
+            interrupted = [row["id"] for row in unfinished if row["owner"] is None or not _process_alive(row["owner"])]
+            connection.executemany(
+                "UPDATE jobs SET status = ?, error = ? WHERE id = ?",
+                [(FAILED, "Interrupted by a restart", job_id) for job_id in interrupted]
+            )
+
+        self.max_workers = max_workers or int(getenv('RENDER_WORKERS', 2))
+        self.pool = self._start_pool()
+
+    def _start_pool(self) -> ProcessPoolExecutor:
+        # spawn, as the Streamlit server runs threads that must not be forked
+        return ProcessPoolExecutor(max_workers=self.max_workers, mp_context=get_context("spawn"))
+
+    @staticmethod
+    def get() -> "RenderQueue":
+        """The render queue shared by every page and session of this server process."""
+        with RenderQueue._instance_lock:
+            if RenderQueue._instance is None:
+                RenderQueue._instance = RenderQueue()
+                atexit.register(lambda: RenderQueue._instance.pool.shutdown(wait=False, cancel_futures=True))
+            return RenderQueue._instance
+
+    def submit(self, kind: str, function, params: dict, story: str = None) -> str:
+        """
+        Queue function(params, progress) for a worker process and return the job id. function must be a
+        module level function, and params and its result must be picklable and JSON serializable respectively.
+        """
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with closing(_connect(self.db_path)) as connection, connection:
+            connection.execute(
+                "INSERT INTO jobs (id, kind, story, status, done, total, created, updated, owner) VALUES (?, ?, ?, ?, 0, 0, ?, ?, ?)",
+                (job_id, kind, story, QUEUED, now, now, os.getpid())
+            )
+
+        try:
+            future = self.pool.submit(_run_job, self.db_path, job_id, function, params)
+        except BrokenProcessPool:
+            # A worker died, e.g. killed for its memory use, and took the pool down with it
+            self.pool = self._start_pool()
+            future = self.pool.submit(_run_job, self.db_path, job_id, function, params)
+
+        # _run_job records its own failures, this catches a worker dying in the middle of the job
+        future.add_done_callback(lambda done: done.exception() and _update(self.db_path, job_id, status=FAILED, error=str(done.exception())))
+        return job_id
+
+    @staticmethod
+    def _as_dict(row: sqlite3.Row) -> dict:
+        job = dict(row)
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def status(self, job_id: str) -> dict:
+        """The job as a dict: status, done, total, unit, eta (seconds), result and error. None for an unknown id."""
+        with closing(_connect(self.db_path)) as connection, connection:
+            row = connection.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return RenderQueue._as_dict(row) if row else None
+
+    def jobs(self, story: str = None, kind: str = None, limit: int = 20) -> list:
+        """Most recent jobs first, optionally of one story and kind."""
+        query, values = "SELECT * FROM jobs WHERE 1 = 1", []
+        if story:
+            query, values = query + " AND story = ?", values + [story]
+        if kind:
+            query, values = query + " AND kind = ?", values + [kind]
+
+        with closing(_connect(self.db_path)) as connection, connection:
+            rows = connection.execute(query + " ORDER BY created DESC LIMIT ?", values + [limit]).fetchall()
+        return [RenderQueue._as_dict(row) for row in rows]
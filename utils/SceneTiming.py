@@ -0,0 +1,122 @@
+import json, math, re
+from collections import Counter
+from os import path
+
+from utils import MediaProbe
+from utils.Utils import split_sentences
+
+'''
+Note: Scene durations that follow the narration.
+Every scenery description is matched to the English sentence it illustrates, which gives the position of the scene
+in the story. The position is carried over proportionally to the Hindi narration, and each scene change is snapped
+to the start of the nearest spoken sentence in the timing map of the audio, so cuts fall between sentences.
+'''
+
+WORD = re.compile(r"[a-z]{3,}")
+
+# Share of the sceneries after the first that must match the story in order for their timing to be followed
+MIN_MATCHED_SHARE = 0.5
+
+def load_timings(audio) -> list:
+    """Timing map of audio, read from its .timing.json file when it is not in memory."""
+    if audio is None:
+        return []
+    if audio.timings:
+        return audio.timings
+
+    timings_path = audio.timings_path or (path.splitext(audio.path)[0] + ".timing.json" if audio.path else None)
+    if timings_path and path.exists(timings_path):
+        with open(timings_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    return []
+
+def _scene_positions(descriptions: list, english_text: str) -> list:
+    """
+    Fraction of the English text at which every scenery starts, in scenery order.
+    None when too few sceneries match the story in order to place the others between them.
+    """
+    sentences = split_sentences(english_text)
+    if not sentences:
+        return None
+
+    words = [set(WORD.findall(sentence.lower())) for sentence in sentences]
+    document_frequency = Counter(word for sentence_words in words for word in sentence_words)
+    idf = {word: math.log(len(sentences) / count) + 1 for word, count in document_frequency.items()}
+
+    total = sum(len(sentence) for sentence in sentences)
+    starts, offset = [], 0
+    for sentence in sentences:
+        starts.append(offset / total)
+        offset += len(sentence)
+
+    matches = []
+    for description in descriptions:
+        description_words = set(WORD.findall(description.lower()))
+        scores = [sum(idf[word] for word in description_words & sentence_words) for sentence_words in words]
+        best = max(range(len(sentences)), key=lambda index: scores[index])
+        matches.append(starts[best] if scores[best] > 0 else None)
+
+    # The story never goes backwards: the longest run of matches that moves forward is kept, the first scenery
+    # starting the story whatever it matched
+    candidates = [(index, position) for index, position in enumerate(matches) if index > 0 and position is not None and position > 0]
+    chains = []
+    for index, position in candidates:
+        longest = max((chain for chain in chains if chain[-1][1] < position), key=len, default=[])
+        chains.append(longest + [(index, position)])
+    anchors = [(0, 0.0)] + max(chains, key=len, default=[])
+
+    if (len(anchors) - 1) / max(1, len(descriptions) - 1) < MIN_MATCHED_SHARE:
+        return None
+
+    # Sceneries without a match in order are spread between the matched ones around them
+    anchors.append((len(descriptions), 1.0))
+    positions = []
+    for (start_index, start), (end_index, end) in zip(anchors, anchors[1:]):
+        for index in range(start_index, end_index):
+            positions.append(start + (end - start) * (index - start_index) / (end_index - start_index))
+
+    return positions
+
+def scene_durations(descriptions: list, english_text: str, timings: list, total_duration: float) -> list:
+    """
+    Duration of every scene, in the order of descriptions, so that each scene covers the sentences of the narration
+    its scenery describes. The first scene also covers the introduction and the last one the conclusion.
+    Returns None when the narration has fewer sentences than there are scenes, or too few sceneries match the story.
+    """
+    body = [timing for timing in timings if timing.get("segment", "body") == "body"]
+    if len(descriptions) < 2:
+        return [total_duration] if descriptions else None
+    if len(body) < len(descriptions) or not english_text:
+        return None
+
+    positions = _scene_positions(descriptions, english_text)
+    if positions is None:
+        return None
+
+    # Fraction of the Hindi narration spoken before every body sentence
+    total = sum(len(timing["text"]) for timing in body) or 1
+    fractions, offset = [], 0
+    for timing in body:
+        fractions.append(offset / total)
+        offset += len(timing["text"])
+
+    # Every scene change goes to the sentence start nearest to its position, keeping one sentence for each later scene
+    cuts, previous = [], 0
+    for scene, position in enumerate(positions[1:], start=1):
+        last_allowed = len(body) - (len(descriptions) - scene)
+        candidates = range(previous + 1, last_allowed + 1)
+        previous = min(candidates, key=lambda index: abs(fractions[index] - position))
+        cuts.append(body[previous]["start"])
+
+    boundaries = [0.0] + cuts + [total_duration]
+    return [round(end - start, 3) for start, end in zip(boundaries, boundaries[1:])]
+
+def scene_durations_for(audio, descriptions: list, english_text: str) -> list:
+    """scene_durations() for the narration of an Audio object, None when there is no narration to follow."""
+    if audio is None or not audio.path or not path.exists(audio.path):
+        return None
+
+    durations = scene_durations(descriptions, english_text, load_timings(audio), MediaProbe.duration(audio.path))
+    if durations is None:
+        print("Warning: Scene timing could not follow the narration, splitting the audio evenly")
+    return durations
@@ -0,0 +1,88 @@
+import math, re
+from collections import Counter
+from os import path
+from threading import Lock
+
+from utils.Utils import read_json, write_json
+
+class SceneryIndex:
+    """
+    Local similarity index over the sceneries of past stories.
+
+    Every generated image is indexed by its scenery title, description and adjectives
+    using TF-IDF weighted character n-grams, so no external service or model is
+    needed. Before generating a new image, a scenery can be looked up in the index
+    and an existing image reused when a past scenery is similar enough.
+    """
+    NGRAM_RANGE = (3, 5)
+
+    def __init__(self, index_path: str = "./output/images/scenery_index.json", threshold: float = 0.75):
+        self.index_path = index_path
+        self.threshold = threshold
+        self._lock = Lock()
+        self.entries = self._load()
+
+    @staticmethod
+    def scenery_text(title: str, description: str, adjectives: list) -> str:
+        # Split CamelCase titles such as "ForestClearing" into words
+        title_words = re.sub(r"(?<=[a-z])(?=[A-Z])", " ", title or "")
+        return " ".join([title_words, description or "", " ".join(adjectives or [])])
+
+    @staticmethod
+    def _ngrams(text: str) -> Counter:
+        text = " " + re.sub(r"\s+", " ", text.lower()).strip() + " "
+        low, high = SceneryIndex.NGRAM_RANGE
+        return Counter(text[i:i + n] for n in range(low, high + 1) for i in range(len(text) - n + 1))
+
+    def _load(self) -> list:
+        return read_json(self.index_path, [], "scenery index")
+
+    def _save(self) -> None:
+        write_json(self.index_path, self.entries)
+
+    def add(self, title: str, description: str, adjectives: list, image_path: str) -> None:
+        text = SceneryIndex.scenery_text(title, description, adjectives)
+
+        with self._lock:
+            # A regenerated scenery replaces its earlier entry
+            self.entries = [entry for entry in self.entries if entry.get("path") != image_path]
+            self.entries.append({"title": title, "text": text, "path": image_path})
+            self._save()
+
+    def find(self, title: str, description: str, adjectives: list, exclude_path: str = None) -> tuple:
+        """Return the most similar indexed scenery and its similarity, or (None, 0.0) if none is above the threshold."""
+        with self._lock:
+            entries = [entry for entry in self.entries if entry.get("path") != exclude_path and path.exists(entry.get("path", ""))]
+
+        if not entries:
+            return None, 0.0
+
+        query = SceneryIndex._ngrams(SceneryIndex.scenery_text(title, description, adjectives))
+        documents = [SceneryIndex._ngrams(entry["text"]) for entry in entries]
+
+        # Smoothed inverse document frequency over the indexed sceneries and the query
+        document_frequency = Counter()
+        for counts in documents + [query]:
+            document_frequency.update(counts.keys())
+        total = len(documents) + 1
+        idf = {gram: math.log((1 + total) / (1 + df)) + 1 for gram, df in document_frequency.items()}
+
+        def weigh(counts: Counter) -> tuple:
+            vector = {gram: count * idf[gram] for gram, count in counts.items()}
+            return vector, math.sqrt(sum(weight * weight for weight in vector.values()))
+
+        query_vector, query_norm = weigh(query)
+        best_entry, best_similarity = None, 0.0
+        for entry, counts in zip(entries, documents):
+            vector, norm = weigh(counts)
+            if not norm or not query_norm:
+                continue
+            dot = sum(weight * vector.get(gram, 0.0) for gram, weight in query_vector.items())
+            similarity = dot / (query_norm * norm)
+            if similarity > best_similarity:
+                best_entry, best_similarity = entry, similarity
+
+        if best_similarity < self.threshold:
+            return None, best_similarity
+
+        return best_entry, best_similarity
@@ -0,0 +1,132 @@
+import hashlib, json, os, time, uuid
+from os import getenv, makedirs, path
+
+# Part of every key, raised whenever a change to the encoder changes the pixels of segments already cached
+SEGMENT_VERSION = 2
+
+# Holds and partial segments untouched for this long are left over from renders that did not finish
+STALE_AFTER_SECONDS = 24 * 60 * 60
+
+class SegmentCache:
+    """
+    Content addressed cache of encoded video segments, one per scene and rendition.
+
+    Segments are keyed by a hash of everything that changes their pixels: the
+    prepared frame, the frame count, the motion effect, the part of the scene
+    left out of transitions, the transition it opens with and the encoder profile.
+    Regenerating one scenery image therefore only misses the segments of that
+    scene. A hit refreshes the file's modification time, and the least recently
+    used segments are removed once the cache grows beyond max_bytes.
+
+    A cache may get only a share of the total budget, so that caches in separate
+    directories, e.g. of preview and final renders, never evict each other.
+
+    Several renders may share the cache at once. Each one names the segments it
+    uses in a hold file, and evict() leaves the segments of every hold alone.
+    """
+    def __init__(self, cache_dir: str = "./output/videos/.segments", max_bytes: int = None, share: float = 1.0):
+        self.cache_dir = path.abspath(cache_dir)
+        self.max_bytes = int((max_bytes or int(getenv('VIDEO_SEGMENT_CACHE_MAX_BYTES', 2 * 1024 * 1024 * 1024))) * share)
+
+        self.holds_dir = path.join(self.cache_dir, ".holds")
+
+        makedirs(self.holds_dir, exist_ok=True)
+
+    @staticmethod
+    def frame_hash(frame: bytes) -> str:
+        return hashlib.sha1(frame).hexdigest()
+
+    @staticmethod
+    def key(frame_hash: str, frame_count: int, effect: str, profile: dict, window: list = None, incoming: list = None) -> str:
+        material = [SEGMENT_VERSION, frame_hash, frame_count, effect, profile] + ([window] if window else []) + ([incoming] if incoming else [])
+        material = json.dumps(material, sort_keys=True)
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def path(self, key: str) -> str:
+        return path.join(self.cache_dir, key + ".mp4")
+
+    def partial_path(self, key: str) -> str:
+        """
+        A new file to encode a segment to, it only becomes visible under path() once committed.
+        The name is unique, so renders that encode the same segment at once do not write to the same file.
+        """
+        return path.join(self.cache_dir, f"{key}.{os.getpid()}-{uuid.uuid4().hex}.part.mp4")
+
+    def commit(self, key: str, partial_path: str) -> str:
+        os.replace(partial_path, self.path(key))
+        return self.path(key)
+
+    def hold(self) -> str:
+        """Start the hold of a render, returns the hold to add its segments to and to release once it is done."""
+        hold_path = path.join(self.holds_dir, f"{os.getpid()}-{uuid.uuid4().hex}.txt")
+        open(hold_path, "w", encoding="utf-8").close()
+        return hold_path
+
+    def add_to_hold(self, hold_path: str, segment_path: str) -> None:
+        with open(hold_path, "a", encoding="utf-8") as f:
+            f.write(segment_path + "\n")
+
+    def release(self, hold_path: str) -> None:
+        try:
+            os.remove(hold_path)
+        except OSError:
+            pass
+
+    def _held(self) -> set:
+        """Segments in the holds of running renders, holds left behind by renders that died are removed."""
+        held = set()
+        for name in os.listdir(self.holds_dir):
+            hold_path = path.join(self.holds_dir, name)
+            try:
+                if time.time() - os.stat(hold_path).st_mtime > STALE_AFTER_SECONDS:
+                    os.remove(hold_path)
+                    continue
+                with open(hold_path, encoding="utf-8") as f:
+                    held.update(line.strip() for line in f if line.strip())
+            except OSError:
+                pass
+        return held
+
+    def get(self, key: str) -> str:
+        """Path of the cached segment for key, or None if it is not cached."""
+        segment_path = self.path(key)
+        if not path.exists(segment_path):
+            return None
+
+        os.utime(segment_path)
+        return segment_path
+
+    def evict(self, keep: list = ()) -> None:
+        """Remove least recently used segments beyond max_bytes, never those in keep or held by a render."""
+        keep = {path.abspath(segment_path) for segment_path in keep} | self._held()
+        segments = []
+        for name in os.listdir(self.cache_dir):
+            segment_path = path.join(self.cache_dir, name)
+            if not name.endswith(".mp4"):
+                continue
+            try:
+                stat = os.stat(segment_path)
+            except OSError:
+                continue
+
+            if not name.endswith(".part.mp4"):
+                segments.append((stat.st_mtime, stat.st_size, segment_path))
+            elif time.time() - stat.st_mtime > STALE_AFTER_SECONDS:
+                # Left over by a render that failed while encoding it
+                try:
+                    os.remove(segment_path)
+                except OSError:
+                    pass
+
+        total = sum(size for _, size, _ in segments)
+        for _, size, segment_path in sorted(segments):
+            if total <= self.max_bytes:
+                break
+            if segment_path in keep:
+                continue
+
+            try:
+                os.remove(segment_path)
+                total -= size
+            except OSError:
+                pass
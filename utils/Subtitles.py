@@ -0,0 +1,113 @@
+import os, textwrap
+from os import path
+
+from utils.Ffmpeg import run_ffmpeg
+from utils.Utils import split_sentences
+
+'''
+Note: Subtitles from the narration timing map of story.Audio.
+Hindi cues are the spoken sentences themselves. English sentences are laid over the Hindi narration in proportion
+to their share of the text, as the two texts are translations of one another. Cues are written as SRT and WebVTT,
+and muxed into finished videos as soft mov_text tracks by stream copy, so captions never cause a re-render.
+'''
+
+LINE_LENGTH = 42  # Characters per caption line
+MAX_LINES = 2
+
+# ISO 639-2 codes for the MP4 track language
+LANGUAGE_CODES = {"hi": "hin", "en": "eng"}
+
+def _split_cue(start: float, end: float, text: str) -> list:
+    """Split a cue that does not fit in MAX_LINES lines, sharing its time in proportion to the text."""
+    lines = textwrap.wrap(text, LINE_LENGTH)
+    chunks = ["\n".join(lines[index:index + MAX_LINES]) for index in range(0, len(lines), MAX_LINES)] or [text]
+
+    total = sum(len(chunk) for chunk in chunks) or 1
+    cues, chunk_start = [], start
+    for chunk in chunks:
+        chunk_end = chunk_start + (end - start) * len(chunk) / total
+        cues.append((chunk_start, chunk_end, chunk))
+        chunk_start = chunk_end
+    return cues
+
+def hindi_cues(timings: list) -> list:
+    """(start, end, text) cues of every spoken sentence, introduction and conclusion included."""
+    cues = []
+    for timing in timings:
+        cues += _split_cue(timing["start"], timing["end"], timing["text"])
+    return cues
+
+def english_cues(english_text: str, timings: list) -> list:
+    """(start, end, text) cues of the English sentences, placed over the time of the Hindi story body."""
+    body = [timing for timing in timings if timing.get("segment", "body") == "body"]
+    sentences = split_sentences(english_text or "")
+    if not body or not sentences:
+        return []
+
+    # Piecewise linear map from the fraction of the Hindi body text to narration time
+    total = sum(len(timing["text"]) for timing in body) or 1
+    fractions, times, offset = [], [], 0
+    for timing in body:
+        fractions += [offset / total, (offset + len(timing["text"])) / total]
+        times += [timing["start"], timing["end"]]
+        offset += len(timing["text"])
+
+    def time_at(fraction: float) -> float:
+        for index in range(1, len(fractions)):
+            if fraction <= fractions[index]:
+                span = fractions[index] - fractions[index - 1]
+                weight = (fraction - fractions[index - 1]) / span if span else 0.0
+                return times[index - 1] + (times[index] - times[index - 1]) * weight
+        return times[-1]
+
+    english_total = sum(len(sentence) for sentence in sentences)
+    cues, offset = [], 0
+    for sentence in sentences:
+        start, end = time_at(offset / english_total), time_at((offset + len(sentence)) / english_total)
+        cues += _split_cue(start, end, sentence)
+        offset += len(sentence)
+    return cues
+
+def _timestamp(seconds: float, separator: str) -> str:
+    milliseconds = int(round(seconds * 1000))
+    hours, milliseconds = divmod(milliseconds, 3600000)
+    minutes, milliseconds = divmod(milliseconds, 60000)
+    seconds, milliseconds = divmod(milliseconds, 1000)
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d}{separator}{milliseconds:03d}"
+
+def write_srt(cues: list, file_path: str) -> str:
+    with open(file_path, "w", encoding="utf-8") as f:
+        for index, (start, end, text) in enumerate(cues, start=1):
+            f.write(f"{index}\n{_timestamp(start, ',')} --> {_timestamp(end, ',')}\n{text}\n\n")
+    return file_path
+
+def write_vtt(cues: list, file_path: str) -> str:
+    with open(file_path, "w", encoding="utf-8") as f:
+        f.write("WEBVTT\n\n")
+        for start, end, text in cues:
+            f.write(f"{_timestamp(start, '.')} --> {_timestamp(end, '.')}\n{text}\n\n")
+    return file_path
+
+def mux_subtitles(video_path: str, subtitles: dict) -> str:
+    """
+    Replace the subtitle tracks of video_path with the SRT files of subtitles, {language: srt path}.
+    Audio and video are copied as they are. Raises subprocess.CalledProcessError if ffmpeg fails.
+    """
+    args = ["-i", video_path]
+    for srt_path in subtitles.values():
+        args += ["-i", srt_path]
+
+    # Subtitle tracks muxed before are dropped, the new ones take their place
+    args += ["-map", "0:v", "-map", "0:a?"]
+    for index in range(len(subtitles)):
+        args += ["-map", f"{index + 1}:s"]
+    args += ["-c:v", "copy", "-c:a", "copy", "-c:s", "mov_text"]
+    for index, language in enumerate(subtitles):
+        args += [f"-metadata:s:s:{index}", f"language={LANGUAGE_CODES.get(language, language)}"]
+
+    base, extension = path.splitext(video_path)
+    temp_path = base + ".subtitled" + extension
+    run_ffmpeg(args + ["-movflags", "+faststart", temp_path])
+    os.replace(temp_path, video_path)
+
+    return video_path
@@ -0,0 +1,43 @@
+import numpy as np
+
+from utils.Motion import motion_frames
+
+'''
+Note: Transitions between scenes, rendered only on the frames around each cut.
+The last frames of the outgoing scene and the first frames of the incoming one are blended in NumPy as raw RGB24
+buffers, so the frames of a transition cost a multiply-add each and the scenes themselves stay still image segments.
+'''
+
+TRANSITIONS = ("none", "crossfade")
+
+def transition_frames(transition: str, duration: float, fps: int) -> int:
+    """Frames of every transition for a transition setting and its duration in seconds, 0 when scenes are cut."""
+    if transition not in TRANSITIONS:
+        raise ValueError(f"Unknown transition {transition}, expected one of {TRANSITIONS}")
+    return 0 if transition == "none" else max(0, int(round(duration * fps)))
+
+def crossfade_frames(outgoing: tuple, incoming: tuple, size: tuple, tail: int, head: int):
+    """
+    Yield tail + head raw RGB24 frames blending the outgoing scene into the incoming one. Both scenes are
+    (frame, effect, frame_count) as encoded. tail frames come from the end of the outgoing scene and head frames
+    from the start of the incoming one, each scene holding its first or last frame while the other one moves on.
+    """
+    frame_a, effect_a, count_a = outgoing
+    frame_b, effect_b, count_b = incoming
+    length = tail + head
+
+    a_frames = motion_frames(frame_a, size, effect_a, count_a, count_a - max(tail, 1), count_a)
+    b_frames = motion_frames(frame_b, size, effect_b, count_b, 0, max(head, 1))
+    a, b = next(a_frames), next(b_frames)
+
+    for index in range(length):
+        if 0 < index < tail:
+            a = next(a_frames)
+        if index > tail:
+            b = next(b_frames)
+
+        # Integer weights out of 256, the first and last frames are already part way into the blend
+        weight = round(256 * (index + 1) / (length + 1))
+        blended = (np.frombuffer(a, dtype=np.uint8).astype(np.uint16) * (256 - weight)
+                   + np.frombuffer(b, dtype=np.uint8).astype(np.uint16) * weight) >> 8
+        yield blended.astype(np.uint8).tobytes()
@@ -0,0 +1,46 @@
+from math import log
+from PIL import Image as PILImage, ImageOps
+
+def generation_size(profile_width: int, profile_height: int, target: tuple) -> tuple:
+    """
+    Size to request from the image generator when the result is upscaled to target locally.
+
+    Both sides are multiples of 64 as Stable Diffusion requires, and the pixel count stays within
+    that of the profile. Of the sizes that keep at least half of those pixels,
+    the one closest to the aspect ratio of the target is taken, the larger one on a tie.
+    """
+    target_width, target_height = target
+    aspect = log(target_width / target_height)
+    area = profile_width * profile_height
+
+    candidates = [
+        (width, height)
+        for width in range(64, area // 64 + 1, 64)
+        for height in range(64, area // width + 1, 64)
+        if width * height * 2 >= area
+    ]
+    if not candidates:
+        return 64, 64
+
+    return min(candidates, key=lambda size: (round(abs(log(size[0] / size[1]) - aspect), 6), -size[0] * size[1]))
+
+def parse_size(size: str) -> tuple:
+    """Parse a size such as "1024x768", returns None for an empty value."""
+    if not size:
+        return None
+
+    width, height = size.lower().split("x")
+    return int(width), int(height)
+
+def upscale_image(image_path: str, size: tuple, output_path: str = None) -> str:
+    """Resample an image to size with Lanczos, cropping to the target aspect ratio if needed."""
+    output_path = output_path or image_path
+
+    with PILImage.open(image_path) as img:
+        img = img.convert('RGB')
+        if img.size != tuple(size):
+            # ImageOps.fit crops and resizes in a single resampling pass
+            img = ImageOps.fit(img, size, method=PILImage.LANCZOS)
+        img.save(output_path)
+
+    return output_path
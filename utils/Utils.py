@@ -1,4 +1,4 @@
-import itertools, json, re, requests, os
+import itertools, json, re, requests, os, tempfile
 from openai import OpenAI
 from tenacity import (
     retry,
@@ -15,6 +15,7 @@ Also, the functions are in alphabetical order of their names. Please keep it tha
 '''
 
 MULTISPACE = r'[^\S\n]+' # Regex to match multiple spaces
+SENTENCE_BOUNDARY = r'(?<=[।॥?!.])\s+|\n\s*\n' # Regex to match whitespace after a sentence or between paragraphs
 
 def batched(iterable, n) -> iter:
     """Batch data into tuples of length n. The last batch may be shorter."""
@@ -106,6 +107,23 @@ def num_tokens_from_string(string: str, encoding_name: str) -> int:
     num_tokens = len(encoding.encode(string))
     return num_tokens
 
+def read_json(file_path: str, default, description: str = "file"):
+    """Content of a JSON file, or default if it does not exist or cannot be read, which is reported as the description."""
+    if not os.path.exists(file_path):
+        return default
+
+    try:
+        with open(file_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Warning: Ignoring unreadable {description} {file_path}: {e}")
+        return default
+
+def split_sentences(text: str) -> list:
+    """Split Hindi or English text into sentences at danda, question, exclamation and full stop marks."""
+    sentences = re.split(SENTENCE_BOUNDARY, text)
+    return [re.sub(r'\s+', ' ', sentence).strip() for sentence in sentences if sentence.strip()]
+
 def urlify(s: str) -> str:
     # Remove all non-word characters (everything except numbers and letters)
     s = re.sub(r"[^\w\s]", '', s)
@@ -148,3 +166,21 @@ def usage(exit_code: int) -> None:
     print("\t-u, --url\t\t\t\tUrl to get story from")
     print("\t-y, --help\t\t\t\tPublish to YouTube")
     exit(exit_code)
+
+def write_json(file_path: str, data) -> None:
+    """Write data to a JSON file atomically, a crash or a concurrent writer never leaves it half written."""
+    directory = os.path.dirname(file_path) or "."
+    os.makedirs(directory, exist_ok=True)
+
+    # Every write gets a temporary file of its own, which replaces the file once complete
+    fd, temp_path = tempfile.mkstemp(prefix=os.path.basename(file_path) + ".", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2, ensure_ascii=False)
+        os.replace(temp_path, file_path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise